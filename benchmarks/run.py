@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_plays
+from plays_filter import DEFAULT_FILTERS, filter_plays, query_index, take_rows
+from plays_ids import play_details
+from plays_search import search_index, search_plays
+from plays_similar import similar_plays
+from plays_store import GENRE_OPTIONS, ID_COLUMN, PLAY_COLUMNS, STRING_DTYPES, PlaysSnapshot, PlaysStore, coerce_types, load_plays
+from plays_writer import PlaysWriter
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+QUERIES = ["natak", "नाटक", "sagle", "देशपांडे", "kulkarni", "prem", "ek"]
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000.0
+    return {
+        "n": len(values),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+# Time `fn(i)` `repeat` times, then run it a few more times under tracemalloc
+# for the peak memory (kept separate so tracing does not skew the timings)
+def measure(fn, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    result = percentiles(samples)
+    tracemalloc.start()
+    for i in range(min(repeat, 3)):
+        fn(i)
+    result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result
+
+
+def random_filters(rng):
+    filters = dict(DEFAULT_FILTERS)
+    if rng.random() < 0.5:
+        filters["genres"] = list(rng.choice(GENRE_OPTIONS, size=rng.integers(1, 3), replace=False))
+    filters["acts"] = float(rng.choice([-1, -1, 0, 1, 2, 3]))
+    lo = int(rng.integers(1500, 2024))
+    filters["year_range"] = (lo, int(rng.integers(lo, 2025)))
+    filters["male_range"] = (0, int(rng.integers(0, 20)))
+    if rng.random() < 0.3:
+        filters["author_english"] = str(rng.choice(QUERIES))
+    return filters
+
+
+def bench_size(n_rows, repeat, workdir, seed):
+    rng = np.random.default_rng(seed)
+    results = {}
+    csv_file = os.path.join(workdir, f"plays_{n_rows}.csv")
+    synthetic_plays(n_rows, seed=seed).to_csv(csv_file, index=False)
+    load_repeat = max(1, min(repeat, 5))
+
+    raw = pd.read_csv(csv_file, dtype=STRING_DTYPES)
+    results["coerce"] = measure(lambda i: coerce_types(raw.copy()), load_repeat)
+    snapshot_file = os.path.splitext(csv_file)[0] + ".feather"
+
+    def cold_load(i):
+        if os.path.exists(snapshot_file):
+            os.remove(snapshot_file)
+        load_plays(csv_file)
+    results["load_csv"] = measure(cold_load, load_repeat)
+    load_plays(csv_file)
+    results["load_snapshot"] = measure(lambda i: load_plays(csv_file), load_repeat)
+
+    store = PlaysStore(csv_file)
+    snapshot = store.current()
+    df = snapshot.df
+    ids = df[ID_COLUMN].to_numpy()
+    # Query and search indexes built from scratch on a fresh snapshot
+    results["build_indexes"] = measure(lambda i: [build(PlaysSnapshot(df, 0)) for build in (query_index, search_index)], 1)
+    # Build this snapshot's indexes up front so the timings below are for
+    # queries only, as in the app after its first rerun
+    filter_plays(snapshot, DEFAULT_FILTERS)
+    search_plays(snapshot, QUERIES[0])
+    play_details(snapshot, int(ids[0]))
+
+    filters = [random_filters(rng) for _ in range(repeat)]
+    results["filter"] = measure(lambda i: take_rows(df, filter_plays(snapshot, filters[i]), PLAY_COLUMNS), repeat)
+    results["search"] = measure(lambda i: search_plays(snapshot, QUERIES[i % len(QUERIES)], limit=50), repeat)
+    picks = rng.choice(ids, size=repeat)
+    results["select"] = measure(lambda i: play_details(snapshot, int(picks[i]), PLAY_COLUMNS), repeat)
+    # Neighbour lookups for different plays, on an index built beforehand
+    similar_plays(snapshot, int(ids[0]))
+    similar_picks = rng.choice(ids, size=repeat, replace=len(ids) < repeat)
+    results["similar"] = measure(lambda i: similar_plays(snapshot, int(similar_picks[i])), repeat)
+
+    # Saves and adds through the writer, as the app does; compaction is left
+    # to an explicit final step so it is measured on its own
+    writer = PlaysWriter(store, batch_window=0, compact_every=10**9, compact_idle=3600)
+
+    def save(i):
+        play_id = int(picks[i])
+        version = int(play_details(store.current(), play_id)["Row Version"])
+        writer.submit_update(play_id, {"Pages": str(i)}, version).result()
+    results["save"] = measure(save, repeat)
+    results["add"] = measure(lambda i: writer.submit_insert([{
+        "Title_Marathi": f"नवीन नाटक {i}", "Title_English": f"Naveen Natak {i}",
+        "Author_Marathi": "लेखक", "Author_English": "Lekhak", "Genre": "Drama",
+    }]).result(), repeat)
+    results["compact"] = measure(lambda i: writer.compact().result(), load_repeat)
+    return results
+
+
+# Compare p50 latencies with an earlier run; ratio > 1 means slower now
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, ops in results.items():
+        for op, stats in ops.items():
+            old = baseline.get(size, {}).get(op)
+            if not old or not old["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / old["p50_ms"]
+            flag = "REGRESSION" if ratio > threshold else ""
+            print(f"{size:>9} {op:<14} {old['p50_ms']:10.3f} -> {stats['p50_ms']:10.3f} ms  x{ratio:5.2f} {flag}")
+            if flag:
+                regressions.append((size, op, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the plays data layer on synthetic catalogues.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="catalogue sizes (rows)")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="p50 slow-down ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            print(f"Benchmarking {size} rows...", flush=True)
+            results[str(size)] = bench_size(size, args.repeat, workdir, args.seed)
+            for op, stats in results[str(size)].items():
+                print(f"  {op:<14} p50 {stats['p50_ms']:10.3f} ms  p99 {stats['p99_ms']:10.3f} ms  peak {stats['peak_mb']:8.1f} MB")
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {os.path.abspath(args.output)}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
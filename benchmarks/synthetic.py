@@ -0,0 +1,60 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from plays_search import transliterate
+from plays_store import CSV_FILE, PLAY_COLUMNS, STRING_DTYPES
+
+DEVANAGARI_WORD = re.compile(r"^[ऀ-ॿ]+$")
+
+# Columns copied (resampled) from the real catalogue as they are
+SAMPLED_COLUMNS = [col for col in PLAY_COLUMNS if col not in ("Title_Marathi", "Title_English", "Author_Marathi", "Author_English")]
+
+
+def _romanize(word):
+    return transliterate(word).capitalize()
+
+
+def _words(values):
+    words = set()
+    for value in values.dropna().astype(str):
+        words.update(w for w in value.split() if DEVANAGARI_WORD.match(w))
+    return np.array(sorted(words), dtype=object)
+
+
+# Synthetic catalogue of `n_rows` plays shaped like `source_csv`: titles and
+# authors are built from the Devanagari words found in the real titles and
+# authors (with their Romanized forms in the English columns), every other
+# column is resampled from the real values, so its distribution (including
+# missing values) matches plays.csv.
+def synthetic_plays(n_rows, source_csv=CSV_FILE, seed=0):
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(source_csv, dtype=STRING_DTYPES)
+    title_words = _words(real["Title_Marathi"])
+    author_words = _words(real["Author_Marathi"])
+    roman_title = np.array([_romanize(w) for w in title_words], dtype=object)
+    roman_author = np.array([_romanize(w) for w in author_words], dtype=object)
+    # Share of real plays whose English title is actually in Devanagari
+    devanagari_english = real["Title_English"].fillna("").str.contains("[ऀ-ॿ]").mean()
+
+    columns = {}
+    n_words = rng.integers(1, 5, size=n_rows)
+    picks = rng.integers(0, len(title_words), size=(n_rows, 4))
+    columns["Title_Marathi"] = [" ".join(title_words[p[:k]]) for p, k in zip(picks, n_words)]
+    columns["Title_English"] = [" ".join(roman_title[p[:k]]) for p, k in zip(picks, n_words)]
+    same_script = rng.random(n_rows) < devanagari_english
+    columns["Title_English"] = np.where(same_script, columns["Title_Marathi"], columns["Title_English"])
+    # A smaller pool of authors, so that authors have several plays each
+    n_authors = max(1, min(n_rows // 5, 50000))
+    first = rng.integers(0, len(author_words), size=n_authors)
+    last = rng.integers(0, len(author_words), size=n_authors)
+    author_m = np.array([f"{author_words[a]} {author_words[b]}" for a, b in zip(first, last)], dtype=object)
+    author_e = np.array([f"{roman_author[a]} {roman_author[b]}" for a, b in zip(first, last)], dtype=object)
+    author = rng.integers(0, n_authors, size=n_rows)
+    columns["Author_Marathi"] = author_m[author]
+    columns["Author_English"] = author_e[author]
+    for col in SAMPLED_COLUMNS:
+        values = real[col].to_numpy(dtype=object)
+        columns[col] = values[rng.integers(0, len(values), size=n_rows)]
+    return pd.DataFrame(columns)[PLAY_COLUMNS]
@@ -0,0 +1,395 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import zlib
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from plays_filter import DEFAULT_FILTERS, filter_plays, query_index
+from plays_grid import DEFAULT_SORT, page_count, sort_positions
+from plays_ids import id_index
+from plays_search import search_index
+from plays_store import CSV_FILE, ID_COLUMN, PLAY_COLUMNS, VERSION_COLUMN, PlaysStore, diff_plays, load_plays
+from plays_writer import apply_changes, change_log_path, read_changes
+
+HOST = "127.0.0.1"
+PORT = 8502
+# Responses kept in memory, least recently used dropped first
+CACHE_SIZE = 1024
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+MAX_LOOKUP_IDS = 1000
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds between checks of the CSV and the change log for new data
+REFRESH_INTERVAL = 0.5
+
+API_COLUMNS = [ID_COLUMN] + PLAY_COLUMNS + [VERSION_COLUMN]
+
+# Full range of each range filter, used for a bound that is not given
+RANGE_LIMITS = {
+    "year_range": ("year_min", "year_max", 1500, 2024),
+    "male_range": ("male_min", "male_max", 0, 100),
+    "female_range": ("female_min", "female_max", 0, 100),
+}
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+# Repeated and comma-separated values: ?genre=Drama&genre=Comedy or ?genre=Drama,Comedy
+def _many(query, name):
+    return [v.strip() for value in query.get(name, []) for v in value.split(",") if v.strip()]
+
+
+def _number(query, name, default, cast=float):
+    value = _one(query, name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be a number") from None
+
+
+# Sidebar filters from query parameters, with the same meaning as on
+# "Display Plays". Range filters only restrict what is asked for: a missing
+# bound is the widget's minimum or maximum.
+def parse_filters(query):
+    filters = dict(DEFAULT_FILTERS)
+    filters["genres"] = _many(query, "genre")
+    filters["acts"] = _number(query, "acts", -1)
+    filters["property"] = _many(query, "property")
+    filters["author_english"] = _one(query, "author", "")
+    filters["author_marathi"] = _one(query, "author_marathi", "")
+    filters["text"] = _one(query, "q", "")
+    for key, (low, high, lowest, highest) in RANGE_LIMITS.items():
+        if _one(query, low) is None and _one(query, high) is None:
+            filters[key] = None
+        else:
+            filters[key] = (_number(query, low, lowest), _number(query, high, highest))
+    return filters
+
+
+def _columns(query):
+    columns = _many(query, "columns") or API_COLUMNS
+    unknown = [col for col in columns if col not in API_COLUMNS]
+    if unknown:
+        raise ApiError(400, f"unknown column(s): {', '.join(unknown)}")
+    return columns
+
+
+def _records(df, rows, columns):
+    return df.iloc[rows, df.columns.get_indexer(columns)].to_json(orient="records", force_ascii=False)
+
+
+# Read-only view of the plays data for the API. refresh() checks the CSV and
+# the writer's change log: new log entries are applied on top of the loaded
+# data, a rewritten CSV (after a compaction) is loaded afresh. It runs off
+# the event loop, and a reloaded store only replaces the current one once
+# its indexes are built, so requests never wait for a reload.
+class PlaysData:
+    def __init__(self, csv_file=CSV_FILE, log_file=None):
+        self.csv_file = csv_file
+        self.log_file = log_file or change_log_path(csv_file)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._csv_stamp = None
+        self._log_offset = 0
+        self.store = None
+        self.last_modified = 0.0
+
+    # (snapshot, tag) as of the last refresh; the tag names this exact state
+    # of the data and changes whenever the CSV or the change log does
+    def current(self):
+        if self.store is None:
+            self.refresh()
+        with self._lock:
+            snapshot = self.store.current()
+            return snapshot, f"{self._csv_stamp[0]:x}-{self._log_offset:x}-{snapshot.version}"
+
+    def refresh(self):
+        with self._refresh_lock:
+            stat = os.stat(self.csv_file)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+            store, offset, last_modified = self.store, self._log_offset, self.last_modified
+            if stamp != self._csv_stamp or log_size < offset:
+                # The API never writes: no typed snapshot next to the CSV.
+                # A compaction rewrites the CSV with what the log already
+                # gave us (plus what we have not read yet), so the new rows
+                # are published as a change and the indexes carried forward;
+                # only a CSV with plays removed or reordered is a new store.
+                df = load_plays(self.csv_file, write_cache=False)
+                change = diff_plays(store.df, df) if store is not None else None
+                if change is None:
+                    store = PlaysStore(self.csv_file, write_cache=False)
+                    last_modified = stat.st_mtime
+                elif change["updated"] or change["appended"]:
+                    store.publish(df, change)
+                    last_modified = max(last_modified, stat.st_mtime)
+                offset = 0
+            if log_size > offset:
+                with open(self.log_file, "rb") as f:
+                    f.seek(offset)
+                    # Only whole lines; the writer may be half-way through one
+                    data = f.read()
+                    complete = data[:data.rfind(b"\n") + 1]
+                if complete:
+                    apply_changes(store, read_changes(complete.decode("utf-8").splitlines()))
+                    offset += len(complete)
+                    last_modified = max(last_modified, os.path.getmtime(self.log_file))
+            if store is not self.store:
+                warm_indexes(store.current())
+            with self._lock:
+                self.store, self._csv_stamp, self._log_offset, self.last_modified = store, stamp, offset, last_modified
+
+
+# Build the indexes requests use, so the first request on new data does not
+# have to
+def warm_indexes(snapshot):
+    query_index(snapshot)
+    search_index(snapshot)
+    id_index(snapshot)
+
+
+# The API itself, independent of the transport: handle() maps a request to
+# (status, headers, body). JSON bodies are cached per data tag and request.
+class PlaysApi:
+    def __init__(self, data, cache_size=CACHE_SIZE):
+        self.data = data
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_tag = None
+        self._cache_lock = threading.Lock()
+
+    def handle(self, method, target, headers=None, body=b""):
+        headers = headers or {}
+        method = "GET" if method == "HEAD" else method
+        try:
+            snapshot, tag = self.data.current()
+            key = (method, target, body)
+            payload = self._cached(tag, key)
+            if payload is None:
+                payload = self._route(snapshot, method, target, body).encode("utf-8")
+                self._store(tag, key, payload)
+        except ApiError as exc:
+            return exc.status, {}, json.dumps({"error": str(exc)}).encode("utf-8")
+        except Exception as exc:
+            return 500, {}, json.dumps({"error": str(exc)}).encode("utf-8")
+        etag = f'"{tag}-{zlib.crc32(repr(key).encode("utf-8")):08x}"'
+        response_headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(self.data.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self._not_modified(headers, etag):
+            return 304, response_headers, b""
+        return 200, response_headers, payload
+
+    def _not_modified(self, headers, etag):
+        if "if-none-match" in headers:
+            return etag in [t.strip() for t in headers["if-none-match"].split(",")] or headers["if-none-match"].strip() == "*"
+        if "if-modified-since" in headers:
+            try:
+                since = parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.data.last_modified) <= since
+        return False
+
+    def _cached(self, tag, key):
+        with self._cache_lock:
+            if tag != self._cache_tag:
+                self._cache.clear()
+                self._cache_tag = tag
+                return None
+            payload = self._cache.get(key)
+            if payload is not None:
+                self._cache.move_to_end(key)
+            return payload
+
+    def _store(self, tag, key, payload):
+        with self._cache_lock:
+            if tag != self._cache_tag:
+                return
+            self._cache[key] = payload
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _route(self, snapshot, method, target, body):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        path = url.path.rstrip("/") or "/"
+        if path == "/plays/lookup":
+            if method == "POST":
+                try:
+                    ids = json.loads(body or b"{}").get("ids", [])
+                except (ValueError, AttributeError):
+                    raise ApiError(400, 'body must be JSON like {"ids": [1, 2]}') from None
+            elif method == "GET":
+                ids = _many(query, "ids")
+            else:
+                raise ApiError(405, "use GET or POST")
+            return self.lookup(snapshot, ids, _columns(query))
+        if method != "GET":
+            raise ApiError(405, "use GET")
+        if path == "/plays":
+            return self.plays(snapshot, query)
+        if path.startswith("/plays/"):
+            play_id = path[len("/plays/"):]
+            if not play_id.isdigit():
+                raise ApiError(404, f"no such play: {play_id}")
+            return self.play(snapshot, int(play_id), _columns(query))
+        if path in ("/", "/version"):
+            return json.dumps({"version": snapshot.version, "plays": len(snapshot.df),
+                               "last_modified": formatdate(self.data.last_modified, usegmt=True)})
+        raise ApiError(404, f"no such resource: {path}")
+
+    # GET /plays: filtered, sorted and paged plays
+    def plays(self, snapshot, query):
+        df = snapshot.df
+        positions = filter_plays(snapshot, parse_filters(query))
+        sort_by = _one(query, "sort", DEFAULT_SORT)
+        if sort_by != DEFAULT_SORT and sort_by not in API_COLUMNS:
+            raise ApiError(400, f"cannot sort by {sort_by}")
+        positions = sort_positions(df, positions, sort_by, ascending=_one(query, "desc", "0") in ("0", "false", ""))
+        page_size = _number(query, "page_size", DEFAULT_PAGE_SIZE, int)
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ApiError(400, f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+        pages = page_count(len(positions), page_size)
+        page = _number(query, "page", 1, int)
+        if not 1 <= page <= pages:
+            raise ApiError(400, f"page must be between 1 and {pages}")
+        rows = positions[(page - 1) * page_size:page * page_size]
+        return (f'{{"version": {snapshot.version}, "total": {len(positions)}, "page": {page}, '
+                f'"page_size": {page_size}, "pages": {pages}, "plays": {_records(df, rows, _columns(query))}}}')
+
+    # GET /plays/<id>
+    def play(self, snapshot, play_id, columns):
+        row = id_index(snapshot).row(play_id)
+        if row is None:
+            raise ApiError(404, f"no such play: {play_id}")
+        return _records(snapshot.df, [row], columns)[1:-1]
+
+    # GET /plays/lookup?ids=1,2,3 or POST /plays/lookup {"ids": [1, 2, 3]}:
+    # the plays found, in the order asked, and the IDs that were not
+    def lookup(self, snapshot, ids, columns):
+        if len(ids) > MAX_LOOKUP_IDS:
+            raise ApiError(400, f"at most {MAX_LOOKUP_IDS} IDs per lookup")
+        try:
+            ids = [int(i) for i in ids]
+        except (TypeError, ValueError):
+            raise ApiError(400, "IDs must be integers") from None
+        index = id_index(snapshot)
+        found = [(play_id, index.row(play_id)) for play_id in ids]
+        rows = np.array([row for _, row in found if row is not None], dtype=np.int64)
+        missing = [play_id for play_id, row in found if row is None]
+        return f'{{"version": {snapshot.version}, "plays": {_records(snapshot.df, rows, columns)}, "missing": {json.dumps(missing)}}}'
+
+
+# Minimal HTTP/1.1 on asyncio streams, with keep-alive. Requests are answered
+# on the event loop: cached answers are a dictionary lookup and the rest are
+# a few vectorized operations on the shared snapshot. Loading new data is
+# left to _refresh_forever.
+async def _serve_client(api, reader, writer):
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            lines = head.decode("latin-1").split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ", 2)
+            except ValueError:
+                break
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                status, extra, body = 400, {}, b'{"error": "invalid Content-Length"}'
+                keep_alive = False
+            elif length > MAX_BODY_BYTES:
+                status, extra, body = 413, {}, b'{"error": "request body too large"}'
+                keep_alive = False
+            else:
+                request_body = await reader.readexactly(length) if length else b""
+                status, extra, body = api.handle(method, target, headers, request_body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            response = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                        "Content-Type: application/json; charset=utf-8",
+                        f"Content-Length: {len(body)}",
+                        "Access-Control-Allow-Origin: *",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+            response += [f"{name}: {value}" for name, value in extra.items()]
+            writer.write(("\r\n".join(response) + "\r\n\r\n").encode("latin-1") + (b"" if method == "HEAD" else body))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+# Keep `data` up to date in a worker thread; the event loop only ever sees
+# the finished result
+async def _refresh_forever(data, interval=REFRESH_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, data.refresh)
+        except Exception as exc:  # e.g. the CSV is being replaced; try again
+            print(f"Refreshing the plays data failed: {exc}", file=sys.stderr)
+        await asyncio.sleep(interval)
+
+
+async def serve(api, host=HOST, port=PORT):
+    server = await asyncio.start_server(lambda r, w: _serve_client(api, r, w), host, port)
+    refresher = asyncio.create_task(_refresh_forever(api.data))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the plays database.")
+    parser.add_argument("--csv", default=CSV_FILE, help="plays database to serve")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+    api = PlaysApi(PlaysData(args.csv))
+    api.data.refresh()  # load before accepting requests
+    print(f"Serving {os.path.abspath(args.csv)} on http://{args.host}:{args.port}/plays")
+    try:
+        asyncio.run(serve(api, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from plays_search import AUTHOR_FIELDS, TITLE_FIELDS, search_keys, trigram_codes
+
+# Name under which the duplicate index is cached on each snapshot
+DEDUPE_INDEX = "dedupe"
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values. Two plays
+# whose key similarity is about 0.5 or more share a band with high probability.
+NUM_HASHES = 64
+BAND_ROWS = 4
+NUM_BANDS = NUM_HASHES // BAND_ROWS
+PRIME = (1 << 31) - 1
+
+# Fields a play's shingles come from
+FIELDS = TITLE_FIELDS + AUTHOR_FIELDS
+
+_rng = np.random.RandomState(20240601)
+HASH_A = _rng.randint(1, PRIME, size=NUM_HASHES).astype(np.uint64)
+HASH_B = _rng.randint(0, PRIME, size=NUM_HASHES).astype(np.uint64)
+
+# Suffixes that do not make a play different: "(Hindi Script)", "#2", ...
+SUFFIXES = re.compile(r"\([^)]*\)|#\s*\d+")
+
+# Mixed into the trigram codes of authors, so an author trigram never counts
+# as the same shingle as a title trigram
+AUTHOR_SALT = 0x9E3779B97F4A7C15
+# Odd multiplier scrambling a trigram code before it is reduced mod PRIME
+MIX = 0xBF58476D1CE4E5B9
+# Signature columns of a play that has no title or author at all
+EMPTY = np.uint32(PRIME)
+
+
+def strip_suffixes(text):
+    if not isinstance(text, str):
+        return ""
+    return SUFFIXES.sub(" ", text)
+
+
+# Hash of each trigram code, below PRIME
+def shingle_hashes(codes, salt):
+    mixed = (codes.astype(np.uint64) ^ np.uint64(salt)) * np.uint64(MIX)
+    return (mixed >> np.uint64(33)) % np.uint64(PRIME)
+
+
+# MinHash signatures of many keys at once, one row per key: all their
+# trigrams are hashed in one array and each hash function keeps its minimum
+# per key (np.minimum.reduceat over the runs of each key). A key without
+# trigrams gets EMPTY throughout.
+def key_signatures(keys, salt=0):
+    sigs = np.full((len(keys), NUM_HASHES), EMPTY, dtype=np.uint32)
+    grams, owner = trigram_codes(keys)
+    if not len(grams):
+        return sigs
+    hashes = shingle_hashes(grams, salt)
+    starts = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    for i in range(NUM_HASHES):
+        values = (HASH_A[i] * hashes + HASH_B[i]) % np.uint64(PRIME)
+        sigs[owner[starts], i] = np.minimum.reduceat(values, starts)
+    return sigs
+
+
+# Signatures of the plays in `df`. The shingles of a play are the
+# transliterated trigrams of both titles and both authors (so a Devanagari
+# title typed into the English column still lines up); a MinHash over a
+# union is the element-wise minimum of the MinHashes of its parts, so each
+# distinct title and author key is hashed only once.
+def signatures(df):
+    sigs = np.full((len(df), NUM_HASHES), EMPTY, dtype=np.uint32)
+    for fields, salt in ((TITLE_FIELDS, 0), (AUTHOR_FIELDS, AUTHOR_SALT)):
+        values = [df[field] for field in fields]
+        if fields is TITLE_FIELDS:
+            values = [column.map(strip_suffixes) for column in values]
+        keys = search_keys(pd.concat(values, ignore_index=True))
+        codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+        key_sigs = key_signatures(list(uniques), salt)
+        for part in np.split(codes, len(fields)):
+            np.minimum(sigs, key_sigs[part], out=sigs)
+    return sigs
+
+
+def signature(record):
+    return signatures(pd.DataFrame([{field: record.get(field) for field in FIELDS}]))[0]
+
+
+# One 64-bit bucket key per LSH band and row, mixed from the band's values.
+# Two rows with equal band values always share a key; a rare key shared by
+# different values only adds a candidate, which the similarity check drops.
+def band_keys(sigs):
+    sigs = sigs.astype(np.uint64).reshape(len(sigs), NUM_BANDS, BAND_ROWS)
+    keys = np.zeros((len(sigs), NUM_BANDS), dtype=np.uint64)
+    for i in range(BAND_ROWS):
+        keys = (keys ^ sigs[:, :, i]) * np.uint64(MIX)
+    return keys
+
+
+# MinHash/LSH index over title+author keys. Candidate duplicates come from the
+# LSH buckets and are ranked by estimated similarity (share of equal signature
+# values), so neither lookups nor the cluster report compare all pairs. Each
+# band's buckets are a sorted array of bucket keys with the row of each entry.
+class DuplicateIndex:
+    def __init__(self, df):
+        self._lock = threading.Lock()
+        self.signatures = signatures(df)
+        self.bands = [(np.array([], dtype=np.uint64), np.array([], dtype=np.int64))] * NUM_BANDS
+        self._add(np.arange(len(df)))
+
+    def _add(self, rows):
+        rows = rows[self.signatures[rows, 0] != EMPTY]  # nothing to compare on
+        keys = band_keys(self.signatures[rows])
+        for b, (band, members) in enumerate(self.bands):
+            order = np.lexsort((rows, keys[:, b]))
+            added = keys[order, b]
+            at = np.searchsorted(band, added, side="right")
+            self.bands[b] = (np.insert(band, at, added), np.insert(members, at, rows[order]))
+
+    def _remove(self, rows):
+        for b, (band, members) in enumerate(self.bands):
+            keep = ~np.isin(members, rows)
+            self.bands[b] = (band[keep], members[keep])
+
+    # Applied in place; rows are only ever appended, never removed
+    def updated(self, df, change):
+        with self._lock:
+            grow = len(df) - len(self.signatures)
+            if grow > 0:
+                self.signatures = np.vstack([self.signatures, np.full((grow, NUM_HASHES), EMPTY, dtype=np.uint32)])
+            updated = np.array(change.get("updated", []), dtype=np.int64)
+            rows = np.concatenate([updated, np.array(change.get("appended", []), dtype=np.int64)])
+            if len(updated):
+                self._remove(updated)
+            if len(rows):
+                self.signatures[rows] = signatures(df.iloc[rows])
+                self._add(rows)
+        return self
+
+    def _candidates(self, sig, size):
+        keys = band_keys(sig[None, :])[0]
+        found = []
+        for (band, members), key in zip(self.bands, keys):
+            lo, hi = np.searchsorted(band, key, side="left"), np.searchsorted(band, key, side="right")
+            found.append(members[lo:hi])
+        rows = np.unique(np.concatenate(found))
+        return rows[rows < size]
+
+    # Likely duplicates of a (new or edited) play, best first:
+    # [(row position, similarity), ...]
+    def candidates(self, record, size=None, limit=5, min_similarity=0.5, exclude=None):
+        sig = signature(record)
+        if sig[0] == EMPTY:
+            return []
+        with self._lock:
+            size = len(self.signatures) if size is None else size
+            rows = self._candidates(sig, size)
+            if exclude is not None:
+                rows = rows[rows != exclude]
+            if len(rows) == 0:
+                return []
+            similarity = (self.signatures[rows] == sig).mean(axis=1)
+        keep = similarity >= min_similarity
+        rows, similarity = rows[keep], similarity[keep]
+        order = np.argsort(-similarity, kind="stable")[:limit]
+        return [(int(rows[i]), float(similarity[i])) for i in order]
+
+    # Groups of row positions that look like the same play. Each LSH bucket is
+    # checked against its lowest row only and matches are merged with
+    # union-find, so the work grows with the number of rows, not pairs.
+    def clusters(self, min_similarity=0.6, size=None):
+        with self._lock:
+            size = len(self.signatures) if size is None else size
+            pairs = []
+            for band, members in self.bands:
+                keep = members < size
+                band, members = band[keep], members[keep]
+                if not len(band):
+                    continue
+                start = np.r_[True, band[1:] != band[:-1]]
+                head = np.minimum.reduceat(members, np.flatnonzero(start))[np.cumsum(start) - 1]
+                rows, head = members[members != head], head[members != head]
+                similarity = (self.signatures[rows] == self.signatures[head]).mean(axis=1)
+                match = similarity >= min_similarity
+                pairs.append(np.stack([head[match], rows[match]], axis=1))
+        parent = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                x = parent[x]
+            return x
+
+        for head, row in np.concatenate(pairs or [np.empty((0, 2), dtype=np.int64)]).tolist():
+            a, b = find(head), find(row)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+        groups = {}
+        for row in parent:
+            groups.setdefault(find(row), set()).add(row)
+        for root, members in groups.items():
+            members.add(root)
+        return sorted((sorted(m) for m in groups.values()), key=lambda m: (-len(m), m[0]))
+
+
+def dedupe_index(snapshot):
+    return snapshot.derived(DEDUPE_INDEX, DuplicateIndex)
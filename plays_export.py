@@ -0,0 +1,71 @@
+import gzip
+import io
+
+import numpy as np
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "JSON Lines": (".jsonl", "application/x-ndjson"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# Rows converted at a time; bounds the memory used while exporting
+CHUNK_ROWS = 10000
+
+
+def iter_chunks(df, positions, columns, chunk_rows=CHUNK_ROWS):
+    col_idx = df.columns.get_indexer(columns)
+    for start in range(0, len(positions), chunk_rows):
+        yield df.iloc[positions[start:start + chunk_rows], col_idx]
+
+
+def _write_text(out, df, positions, columns, fmt, chunk_rows):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    if fmt == "JSON Lines":
+        for chunk in iter_chunks(df, positions, columns, chunk_rows):
+            lines = chunk.to_json(orient="records", lines=True, force_ascii=False)
+            text.write(lines if lines.endswith("\n") else lines + "\n")
+    else:
+        header = True
+        for chunk in iter_chunks(df, positions, columns, chunk_rows):
+            chunk.to_csv(text, index=False, header=header)
+            header = False
+        if header:
+            df.iloc[:0, df.columns.get_indexer(columns)].to_csv(text, index=False)
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(out, df, positions, columns, chunk_rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # One schema for all row groups; columns that are empty in the sample
+    # would otherwise be typed as null
+    schema = pa.Schema.from_pandas(df.iloc[:min(len(df), 1000), df.columns.get_indexer(columns)], preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in iter_chunks(df, positions, columns, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# Write the rows at `positions` (all rows if None), restricted to `columns`,
+# to the binary file object `out` chunk by chunk, so no full copy of the
+# export is built in memory.
+def write_export(out, df, positions=None, columns=None, fmt="CSV", chunk_rows=CHUNK_ROWS):
+    if positions is None:
+        positions = np.arange(len(df))
+    columns = list(columns) if columns else list(df.columns)
+    if fmt == "Parquet":
+        _write_parquet(out, df, positions, columns, chunk_rows)
+    elif fmt == "CSV (gzip)":
+        with gzip.GzipFile(fileobj=out, mode="wb") as gz:
+            _write_text(gz, df, positions, columns, "CSV", chunk_rows)
+    elif fmt in EXPORT_FORMATS:
+        _write_text(out, df, positions, columns, fmt, chunk_rows)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
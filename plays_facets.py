@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from plays_filter import filter_masks, genre_bits, property_codes
+from plays_store import ACT_OPTIONS, GENRE_OPTIONS, PROPERTY_OPTIONS
+
+# Name under which the facet index is cached on each snapshot
+FACET_INDEX = "facets"
+
+# Sidebar filter that each facet belongs to; a facet's counts take every
+# active filter into account except its own
+FACET_FILTERS = {
+    "genres": "genres",
+    "acts": "acts",
+    "property": "property",
+    "year": "year_range",
+    "male": "male_range",
+    "female": "female_range",
+}
+
+# Histogram bins: first performance year by decade, cast size up to CAST_MAX
+# (the last bin holds CAST_MAX and more)
+YEAR_FIRST, YEAR_LAST = 1500, 2020
+CAST_MAX = 30
+UNKNOWN = "Unknown"
+
+FACET_LABELS = {
+    "genres": GENRE_OPTIONS,
+    "acts": ACT_OPTIONS + ["Other"],
+    "property": PROPERTY_OPTIONS + ["Other"],
+    "year": list(range(YEAR_FIRST, YEAR_LAST + 10, 10)) + [UNKNOWN],
+    "male": list(range(CAST_MAX + 1)) + [UNKNOWN],
+    "female": list(range(CAST_MAX + 1)) + [UNKNOWN],
+}
+
+
+# Position of each play's act count in ACT_OPTIONS; no value counts as 0
+def acts_codes(values):
+    acts = np.nan_to_num(values.to_numpy(dtype=float), nan=0.0)
+    codes = np.full(len(acts), len(ACT_OPTIONS), dtype=np.int16)
+    for i, option in enumerate(ACT_OPTIONS):
+        codes[acts == option] = i
+    return codes
+
+
+def _bins(values, first, width, last_bin):
+    values = values.to_numpy(dtype=float)
+    codes = np.full(len(values), last_bin + 1, dtype=np.int16)  # unknown
+    known = ~np.isnan(values)
+    codes[known] = np.clip((values[known] - first) // width, 0, last_bin)
+    return codes
+
+
+def year_bins(values):
+    return _bins(values, YEAR_FIRST, 10, (YEAR_LAST - YEAR_FIRST) // 10)
+
+
+def cast_bins(values):
+    return _bins(values, 0, 1, CAST_MAX)
+
+
+def facet_codes(df):
+    return {
+        "genres": genre_bits(df["Genre"]),
+        "acts": acts_codes(df["Number of Acts"]),
+        "property": property_codes(df["Property"]),
+        "year": year_bins(df["First Performance Year"]),
+        "male": cast_bins(df["Male Characters"]),
+        "female": cast_bins(df["Female Characters"]),
+    }
+
+
+# Plays per facet value among `codes`. Genres are multi-valued (bit masks),
+# so a play is counted once for each of its genres.
+def tally(name, codes):
+    if name == "genres":
+        return np.array([np.count_nonzero(codes & np.uint16(1 << i)) for i in range(len(GENRE_OPTIONS))], dtype=np.int64)
+    return np.bincount(codes, minlength=len(FACET_LABELS[name])).astype(np.int64)
+
+
+# Per-row facet codes of one snapshot plus the counts over the whole
+# catalogue. The totals answer the common case (no other filter active)
+# without touching the rows; on add and save only the changed rows are
+# re-coded and their old counts swapped for the new ones.
+class FacetIndex:
+    def __init__(self, df):
+        self.size = len(df)
+        self.codes = facet_codes(df)
+        self.totals = {name: tally(name, codes) for name, codes in self.codes.items()}
+
+    def updated(self, df, change):
+        updated = [row for row in change.get("updated", []) if row < self.size]
+        rows = updated + list(change.get("appended", []))
+        new = FacetIndex.__new__(FacetIndex)
+        new.size = len(df)
+        new.codes, new.totals = {}, {}
+        fresh = facet_codes(df.iloc[rows]) if rows else None
+        for name, codes in self.codes.items():
+            grown = np.zeros(len(df), dtype=codes.dtype)
+            keep = min(self.size, len(df))
+            grown[:keep] = codes[:keep]
+            totals = self.totals[name].copy()
+            if rows:
+                totals -= tally(name, grown[updated])
+                grown[rows] = fresh[name]
+                totals += tally(name, fresh[name])
+            new.codes[name] = grown
+            new.totals[name] = totals
+        return new
+
+    # Counts for every facet given the active filter masks (as returned by
+    # PlayQueryIndex.masks), one Series per facet indexed by FACET_LABELS
+    def counts(self, masks):
+        combined = {}  # excluded filter -> AND of all other masks
+        result = {}
+        for name, key in FACET_FILTERS.items():
+            excluded = key if key in masks else None
+            if excluded not in combined:
+                others = [mask for k, mask in masks.items() if k != excluded]
+                combined[excluded] = np.logical_and.reduce(others) if others else None
+            mask = combined[excluded]
+            counts = self.totals[name] if mask is None else tally(name, self.codes[name][mask])
+            result[name] = pd.Series(counts, index=FACET_LABELS[name])
+        return result
+
+
+def facet_index(snapshot):
+    return snapshot.derived(FACET_INDEX, FacetIndex)
+
+
+# Facet counts for the sidebar `filters` in one snapshot
+def facet_counts(snapshot, filters):
+    return facet_index(snapshot).counts(filter_masks(snapshot, filters))
+
+
+# A year or cast-size facet as a chart-ready Series: the unknown bin is
+# dropped and so are empty bins at either end
+def histogram(counts):
+    counts = counts.drop(UNKNOWN)
+    counts.index = counts.index.astype(int)
+    nonzero = np.flatnonzero(counts.to_numpy())
+    if not len(nonzero):
+        return counts.iloc[:0]
+    return counts.iloc[nonzero[0]:nonzero[-1] + 1]
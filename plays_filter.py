@@ -0,0 +1,199 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from plays_search import AUTHOR_FIELDS, search_index
+from plays_store import GENRE_OPTIONS, PROPERTY_OPTIONS
+
+# Name under which the query index is cached on each snapshot
+QUERY_INDEX = "query"
+
+# Sidebar defaults; a filter left at its default does not restrict anything
+DEFAULT_FILTERS = {
+    "genres": [],
+    "acts": -1,
+    "property": [],
+    "author_english": "",
+    "author_marathi": "",
+    "text": "",
+    "year_range": (1500, 2024),
+    "male_range": (0, 10),
+    "female_range": (0, 10),
+}
+
+# Lowest search score counted as a match for the text filters
+MIN_SCORE = 0.5
+
+# Filters answered by the search index
+SEARCH_FILTERS = ["author_english", "author_marathi", "text"]
+
+RANGE_COLUMNS = {
+    "year_range": "First Performance Year",
+    "male_range": "Male Characters",
+    "female_range": "Female Characters",
+}
+
+
+# Multi-hot genre bits: bit i is set when GENRE_OPTIONS[i] is one of the
+# semicolon-separated genres of the play (whole names only, so "Sci" never
+# matches "Sci-Fi").
+def genre_bits(genres):
+    bits = np.zeros(len(genres), dtype=np.uint16)
+    for i, genre in enumerate(GENRE_OPTIONS):
+        pattern = r"(?:^|;)\s*" + re.escape(genre) + r"\s*(?:;|$)"
+        hit = genres.str.contains(pattern, regex=True, na=False).to_numpy(dtype=bool)
+        bits[hit] |= np.uint16(1 << i)
+    return bits
+
+
+# Position of each play's Property in PROPERTY_OPTIONS; a missing value
+# counts as "Unknown", anything else gets len(PROPERTY_OPTIONS)
+def property_codes(values):
+    values = values.astype(object).where(values.notna(), "Unknown")
+    codes = pd.Categorical(values, categories=PROPERTY_OPTIONS).codes.astype(np.int16)
+    codes[codes < 0] = len(PROPERTY_OPTIONS)
+    return codes
+
+
+# Number of acts per play, with 0 standing for "missing" (no value or an
+# explicit 0)
+def acts_values(values):
+    return np.nan_to_num(values.to_numpy(dtype=float), nan=0.0)
+
+
+def genre_mask(names):
+    mask = 0
+    for name in names:
+        if name in GENRE_OPTIONS:
+            mask |= 1 << GENRE_OPTIONS.index(name)
+    return np.uint16(mask)
+
+
+# Query engine over one snapshot of the plays data. It is built once per data
+# version and turns the whole set of sidebar controls into one selection of row
+# positions without creating intermediate DataFrames.
+class PlayQueryIndex:
+    def __init__(self, df):
+        self.size = len(df)
+        self.genre_bits = genre_bits(df["Genre"])
+        self.acts = acts_values(df["Number of Acts"])
+        self.property_codes = property_codes(df["Property"])
+        # Sorted arrays for the range filters; NaN sorts last and so never
+        # falls inside a range.
+        self.sorted = {}
+        for key, col in RANGE_COLUMNS.items():
+            values = df[col].to_numpy(dtype=float)
+            order = np.argsort(values, kind="stable")
+            self.sorted[key] = (order, values[order])
+
+    # Carry the index forward to a new data version. Only changed and
+    # appended rows are looked at: their codes are recomputed and their
+    # entries in the sorted arrays taken out and put back at their new place.
+    def updated(self, df, change):
+        updated = [row for row in change.get("updated", []) if row < self.size]
+        rows = updated + list(change.get("appended", []))
+        new = PlayQueryIndex.__new__(PlayQueryIndex)
+        new.size = len(df)
+        changed = df.iloc[rows]
+        for name, values in (("genre_bits", genre_bits(changed["Genre"])),
+                             ("acts", acts_values(changed["Number of Acts"])),
+                             ("property_codes", property_codes(changed["Property"]))):
+            old = getattr(self, name)
+            grown = np.zeros(len(df), dtype=old.dtype)
+            keep = min(self.size, len(df))
+            grown[:keep] = old[:keep]
+            grown[rows] = values
+            setattr(new, name, grown)
+        new.sorted = {}
+        for key, col in RANGE_COLUMNS.items():
+            order, values = self.sorted[key]
+            if updated:
+                keep = ~np.isin(order, updated)
+                order, values = order[keep], values[keep]
+            if rows:
+                added = changed[col].to_numpy(dtype=float)
+                at = np.searchsorted(values, added, side="right")
+                order = np.insert(order, at, rows)
+                values = np.insert(values, at, added)
+            new.sorted[key] = (order, values)
+        return new
+
+    def _range_mask(self, key, bounds):
+        order, values = self.sorted[key]
+        lo = np.searchsorted(values, bounds[0], side="left")
+        hi = np.searchsorted(values, bounds[1], side="right")
+        mask = np.zeros(self.size, dtype=bool)
+        mask[order[lo:hi]] = True
+        return mask
+
+    # One boolean mask per active filter, keyed by filter name. Author and
+    # title/author text go through `search`, the snapshot's search index
+    # (needed only when one of them is set), so a query in either script
+    # matches both.
+    def masks(self, filters, search=None, text_scores=None):
+        masks = {}
+        if filters.get("genres"):
+            masks["genres"] = (self.genre_bits & genre_mask(filters["genres"])) != 0
+        acts = filters.get("acts", -1)
+        if acts is not None and acts >= 0:
+            masks["acts"] = self.acts == float(acts)
+        if filters.get("property"):
+            wanted = [PROPERTY_OPTIONS.index(p) for p in filters["property"] if p in PROPERTY_OPTIONS]
+            masks["property"] = np.isin(self.property_codes, wanted)
+        for key in ("author_english", "author_marathi"):
+            if filters.get(key):
+                masks[key] = search.scores(filters[key], AUTHOR_FIELDS, self.size) >= MIN_SCORE
+        if filters.get("text"):
+            if text_scores is None:
+                text_scores = search.scores(filters["text"], size=self.size)
+            masks["text"] = text_scores >= MIN_SCORE
+        for key in RANGE_COLUMNS:
+            if filters.get(key) is not None:
+                masks[key] = self._range_mask(key, filters[key])
+        return masks
+
+    # Combine all active filters into the positions of the matching rows.
+    # With a title/author text query the rows come best match first. If a
+    # `steps` list is given, (filter name, rows still matching) is appended
+    # to it after each filter.
+    def select(self, filters, search=None, steps=None):
+        text_scores = None
+        if filters.get("text"):
+            text_scores = search.scores(filters["text"], size=self.size)
+        combined = np.ones(self.size, dtype=bool)
+        for name, mask in self.masks(filters, search, text_scores).items():
+            combined &= mask
+            if steps is not None:
+                steps.append((name, int(np.count_nonzero(combined))))
+        positions = np.flatnonzero(combined)
+        if text_scores is not None:
+            positions = positions[np.argsort(-text_scores[positions], kind="stable")]
+        return positions
+
+
+def query_index(snapshot):
+    return snapshot.derived(QUERY_INDEX, PlayQueryIndex)
+
+
+# The search index of `snapshot` if `filters` need it, else None; it is only
+# built once someone searches
+def _search_for(snapshot, filters):
+    if any(filters.get(key) for key in SEARCH_FILTERS):
+        return search_index(snapshot)
+    return None
+
+
+# One boolean mask per active sidebar filter in one snapshot
+def filter_masks(snapshot, filters):
+    return query_index(snapshot).masks(filters, _search_for(snapshot, filters))
+
+
+# Positions of the plays matching the sidebar `filters` in one snapshot
+def filter_plays(snapshot, filters, steps=None):
+    return query_index(snapshot).select(filters, _search_for(snapshot, filters), steps)
+
+
+# Rows of `df` at `positions`, restricted to `columns`, in a single take
+def take_rows(df, positions, columns):
+    return df.iloc[positions, df.columns.get_indexer(columns)]
@@ -0,0 +1,36 @@
+import pandas as pd
+
+from plays_store import ID_COLUMN
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Sort option that keeps the order produced by the filters (catalogue order,
+# or best match first for a text search)
+DEFAULT_SORT = "Default order"
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+# Reorder the filtered row positions by one column; missing values go last.
+# Only the sort column of the filtered rows is touched.
+def sort_positions(df, positions, sort_by, ascending=True):
+    if sort_by == DEFAULT_SORT or sort_by not in df.columns or len(positions) == 0:
+        return positions
+    values = pd.Series(df[sort_by].to_numpy()[positions])
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        values = values.str.lower()
+    order = values.sort_values(ascending=ascending, na_position="last", kind="stable").index.to_numpy()
+    return positions[order]
+
+
+# The rows of one page, with only the visible columns. The "Select" column
+# carries each row's Play ID, so a selection stays valid whatever page or sort
+# order it was made on.
+def page_frame(df, positions, page, page_size, columns):
+    start = (page - 1) * page_size
+    rows = positions[start:start + page_size]
+    page_df = df.iloc[rows, df.columns.get_indexer(columns)].reset_index(drop=True)
+    page_df.insert(0, "Select", df[ID_COLUMN].to_numpy()[rows])
+    return page_df
@@ -0,0 +1,69 @@
+import threading
+import unicodedata
+
+from plays_store import ID_COLUMN
+
+# Name under which the ID index is cached on each snapshot
+ID_INDEX = "ids"
+
+
+# Key used for duplicate-title checks: NFC, case-folded, single spaces
+def title_key(title):
+    if not isinstance(title, str):
+        return ""
+    return " ".join(unicodedata.normalize("NFC", title).casefold().split())
+
+
+# Hash indexes over one snapshot: Play ID -> row position, and normalized
+# English title -> Play IDs. Rows are never removed or reordered, so the index
+# is updated in place on add and save and shared by consecutive versions.
+class PlayIdIndex:
+    def __init__(self, df):
+        self._lock = threading.Lock()
+        self.rows = {}
+        self.title_of = {}
+        self.by_title = {}
+        ids = df[ID_COLUMN].tolist()
+        titles = df["Title_English"].tolist()
+        for row, (play_id, title) in enumerate(zip(ids, titles)):
+            self._set(play_id, row, title)
+
+    def _set(self, play_id, row, title):
+        self.rows[play_id] = row
+        old_key = self.title_of.get(play_id)
+        if old_key is not None:
+            self.by_title[old_key].discard(play_id)
+            if not self.by_title[old_key]:
+                del self.by_title[old_key]
+        key = title_key(title)
+        self.title_of[play_id] = key
+        self.by_title.setdefault(key, set()).add(play_id)
+
+    def updated(self, df, change):
+        rows = list(change.get("updated", [])) + list(change.get("appended", []))
+        with self._lock:
+            for row in rows:
+                self._set(int(df[ID_COLUMN].iat[row]), row, df["Title_English"].iat[row])
+        return self
+
+    # Row position of a play, or None
+    def row(self, play_id):
+        return self.rows.get(play_id)
+
+    # Play IDs whose English title matches `title` (case-insensitive)
+    def ids_with_title(self, title):
+        with self._lock:
+            return set(self.by_title.get(title_key(title), ()))
+
+
+def id_index(snapshot):
+    return snapshot.derived(ID_INDEX, PlayIdIndex)
+
+
+# All fields of one play as a dict (only `columns` if given), or None
+def play_details(snapshot, play_id, columns=None):
+    row = id_index(snapshot).row(play_id)
+    if row is None or row >= len(snapshot.df):
+        return None
+    record = snapshot.df.iloc[row]
+    return (record[columns] if columns else record).to_dict()
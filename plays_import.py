@@ -0,0 +1,174 @@
+import argparse
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from plays_ids import id_index, title_key
+from plays_store import (
+    ACT_OPTIONS, AVAILABILITY_OPTIONS, CSV_FILE, GENRE_OPTIONS, NUMERIC_COLUMNS,
+    PLAY_COLUMNS, PROPERTY_OPTIONS, REQUIRED_COLUMNS, STRING_DTYPES, PlaysStore,
+)
+from plays_writer import ChangeLog, change_log_path
+
+# Rows validated per chunk (and per worker task)
+CHUNK_ROWS = 5000
+# Chunks in flight per worker; the file is read no further ahead than this
+CHUNKS_PER_WORKER = 2
+
+
+# Stream a CSV or JSON Lines file (path or file object) in chunks. Each chunk
+# keeps the file's line numbers in its index for the error report.
+def read_chunks(source, fmt=None, chunk_rows=CHUNK_ROWS):
+    if fmt is None:
+        name = source if isinstance(source, str) else getattr(source, "name", "")
+        fmt = "jsonl" if name.lower().endswith((".jsonl", ".json")) else "csv"
+    if fmt == "jsonl":
+        reader = pd.read_json(source, lines=True, chunksize=chunk_rows, dtype=False)
+        first_line = 1
+    else:
+        reader = pd.read_csv(source, chunksize=chunk_rows, dtype=STRING_DTYPES)
+        first_line = 2  # after the header
+    start = 0
+    for chunk in reader:
+        chunk.index = range(start + first_line, start + first_line + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def _split(values):
+    return values.fillna("").astype(str).str.split(";").explode().str.strip()
+
+
+# "a ;b;; c" -> "a; b; c", the form's way of storing several choices
+def _join(values):
+    return values.fillna("").astype(str).str.replace(r"(\s*;\s*)+", "; ", regex=True).str.strip("; ")
+
+
+# Check one chunk against the rules of the "Add a New Play" form. Returns the
+# normalized valid rows and a frame of (line, errors) for the rejected ones.
+def validate_chunk(chunk):
+    chunk = chunk.reindex(columns=PLAY_COLUMNS)
+    errors = pd.Series([[] for _ in range(len(chunk))], index=chunk.index, dtype=object)
+
+    def reject(mask, message):
+        for line in chunk.index[np.asarray(mask, dtype=bool)]:
+            errors[line].append(message)
+
+    for col in REQUIRED_COLUMNS:
+        chunk[col] = chunk[col].fillna("").astype(str).str.strip()
+        reject(chunk[col] == "", f"{col} is compulsory")
+
+    for col in NUMERIC_COLUMNS:
+        raw = chunk[col]
+        values = pd.to_numeric(raw, errors="coerce")
+        blank = raw.isna() | (raw.astype(str).str.strip() == "")
+        reject(values.isna() & ~blank, f"{col} is not a number")
+        chunk[col] = values
+    acts = chunk["Number of Acts"]
+    reject(acts.notna() & ~acts.isin(ACT_OPTIONS), f"Number of Acts must be one of {ACT_OPTIONS}")
+
+    genres = _split(chunk["Genre"])
+    genres = genres[genres != ""]
+    reject(chunk.index.isin(genres.index[~genres.isin(GENRE_OPTIONS)]), "unknown Genre")
+    chunk["Genre"] = _join(chunk["Genre"])
+
+    prop = chunk["Property"].fillna("").astype(str).str.strip()
+    reject((prop != "") & ~prop.isin(PROPERTY_OPTIONS), f"Property must be one of {PROPERTY_OPTIONS}")
+
+    avail = _split(chunk["Availability"])
+    avail = avail[avail != ""]
+    reject(chunk.index.isin(avail.index[~avail.isin(AVAILABILITY_OPTIONS)]), "unknown Availability")
+    # "NULL" is exclusive: drop it when a real source is also listed
+    has_source = chunk.index.isin(avail.index[avail != "NULL"])
+    joined = _join(chunk["Availability"])
+    joined[has_source] = _join(joined[has_source].str.replace(r"(^|; )NULL(?=; |$)", "", regex=True))
+    chunk["Availability"] = joined
+
+    bad = errors.map(len) > 0
+    rejected = pd.DataFrame({"line": chunk.index[bad], "errors": errors[bad].map("; ".join).to_numpy()})
+    return chunk[~bad], rejected
+
+
+# validate_chunk over `chunks`, in order. With several workers at most
+# CHUNKS_PER_WORKER chunks per worker are read ahead of the results. Workers
+# are spawned rather than forked, which is safe from a threaded server.
+def validate_chunks(chunks, workers=None):
+    if workers == 1:
+        yield from map(validate_chunk, chunks)
+        return
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(validate_chunk, chunk))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# Validate the file chunk by chunk on `workers` processes (None: one per CPU,
+# 1: in this process), then merge all valid rows into the store in one pass.
+# Titles already in the catalogue, or repeated in the file, are rejected like
+# in the form. With a PlaysWriter the rows go through its queue; otherwise
+# they are appended to the change log, from which a running app's writer
+# (or the next one to start) folds them into the CSV. Returns (number of
+# plays added, error report).
+def import_plays(store, source, fmt=None, chunk_rows=CHUNK_ROWS, workers=None, dry_run=False, writer=None):
+    results = list(validate_chunks(read_chunks(source, fmt, chunk_rows), workers))
+    valid = pd.concat([r[0] for r in results]) if results else pd.DataFrame(columns=PLAY_COLUMNS)
+    reports = [r[1] for r in results]
+
+    keys = valid["Title_English"].map(title_key)
+    ids = id_index(store.current())
+    existing = keys.map(lambda k: bool(ids.ids_with_title(k))).astype(bool)  # str dtype when empty
+    repeated = keys.duplicated(keep="first")
+    for mask, message in ((existing, "a play with this English title already exists"),
+                          (repeated & ~existing, "English title repeated earlier in the file")):
+        reports.append(pd.DataFrame({"line": valid.index[mask], "errors": message}))
+    valid = valid[~(existing | repeated)]
+
+    report = pd.concat(reports, ignore_index=True).sort_values("line", kind="stable") if reports else pd.DataFrame(columns=["line", "errors"])
+    if len(valid) and not dry_run:
+        if writer is not None:
+            writer.submit_insert(valid.reset_index(drop=True)).result()
+            writer.compact().result()
+        else:
+            ChangeLog(change_log_path(store.csv_file)).insert(store, valid.reset_index(drop=True))
+    return len(valid), report.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import plays from a CSV or JSON Lines file.")
+    parser.add_argument("source", help="CSV or JSON Lines file with one play per row")
+    parser.add_argument("--csv", default=CSV_FILE, help="plays database to import into")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from the file extension)")
+    parser.add_argument("--errors", default="import_errors.csv", help="where to write rejected rows")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=None, help="validation processes (default: one per CPU)")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, do not change the database")
+    args = parser.parse_args(argv)
+
+    store = PlaysStore(args.csv)
+    # Plays added or edited in the app since its last compaction count too
+    log = ChangeLog(change_log_path(args.csv))
+    with log.locked() as f:
+        log.catch_up(f, store)
+    added, report = import_plays(store, args.source, args.format, args.chunk_rows, args.workers, args.dry_run)
+    print(f"{'Valid' if args.dry_run else 'Added'}: {added} plays, rejected: {len(report)} rows")
+    if added and not args.dry_run:
+        print(f"The new plays are in {log.path}; the app's writer folds them into {args.csv}")
+    if len(report):
+        report.to_csv(args.errors, index=False)
+        print(f"Error report written to {os.path.abspath(args.errors)}")
+    return 1 if len(report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+import numpy as np
+
+# Structured timing log: one JSON object per script run, rotated by size.
+# Set PLAYS_PERF_LOG to an empty string to turn it off.
+PERF_LOG = os.environ.get("PLAYS_PERF_LOG", "perf_log.jsonl")
+PERF_LOG_BYTES = 5 * 1024 * 1024
+PERF_LOG_BACKUPS = 5
+
+_current = contextvars.ContextVar("plays_run_timer", default=None)
+_logger = None
+_logger_lock = threading.Lock()
+
+
+# Timing spans of one script run. Code anywhere in the data layer can open a
+# span(); it is recorded against the timer active in the calling thread and
+# costs nothing when there is none (e.g. in the writer thread).
+class RunTimer:
+    def __init__(self):
+        self.spans = []
+        self._depth = 0
+        self._start = time.perf_counter()
+        self._token = None
+        self.total_ms = 0.0
+
+    # Make this the active timer of the calling thread
+    def start(self):
+        self._start = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def stop(self):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        self.total_ms = (time.perf_counter() - self._start) * 1000.0
+        return self.total_ms
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def span(self, name, **info):
+        record = {"name": name, "depth": self._depth, "ms": 0.0, **info}
+        self.spans.append(record)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["ms"] = (time.perf_counter() - start) * 1000.0
+            self._depth -= 1
+
+    def to_record(self, **context):
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **context,
+            "total_ms": round(self.total_ms, 3),
+            "spans": [dict(s, ms=round(s["ms"], 3)) for s in self.spans],
+        }
+
+
+# Time the enclosed block under `name` (extra keyword values, such as row
+# counts, are stored with it). Yields the span record, or a throwaway dict
+# when no timer is active, so callers can add values either way.
+@contextmanager
+def span(name, **info):
+    timer = _current.get()
+    if timer is None:
+        yield dict(info)
+        return
+    with timer.span(name, **info) as record:
+        yield record
+
+
+def perf_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger("plays.perf")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                if PERF_LOG:
+                    handler = RotatingFileHandler(PERF_LOG, maxBytes=PERF_LOG_BYTES,
+                                                  backupCount=PERF_LOG_BACKUPS, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def log_run(timer, **context):
+    record = timer.to_record(**context)
+    logger = perf_logger()
+    if logger.handlers:
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+    return record
+
+
+# Rough size in bytes of the values kept in a session: DataFrames and arrays
+# by their buffers, containers by their items. Shared objects (the store,
+# snapshots) are not in session_state and are not counted.
+def object_bytes(value, _seen=None):
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(object_bytes(k, seen) + object_bytes(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(object_bytes(v, seen) for v in value)
+    return size
+
+
+def session_bytes(state):
+    seen = set()
+    return sum(object_bytes(state[key], seen) for key in list(state.keys()))
+
+
+# Latency percentiles per span name over one or more timing logs
+def summarize(paths):
+    samples, totals = {}, []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                totals.append(record["total_ms"])
+                for s in record["spans"]:
+                    samples.setdefault(s["name"], []).append(s["ms"])
+    samples["(run total)"] = totals
+    rows = []
+    for name, values in samples.items():
+        if not values:
+            continue
+        values = np.asarray(values)
+        rows.append((name, len(values), *np.percentile(values, [50, 90, 99]), values.max()))
+    return sorted(rows, key=lambda r: -r[3])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the app's timing log(s).")
+    parser.add_argument("logs", nargs="*", default=[PERF_LOG], help="timing log files (rotated ones too)")
+    args = parser.parse_args(argv)
+    print(f"{'span':<20} {'n':>7} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for name, n, p50, p90, p99, high in summarize(args.logs):
+        print(f"{name:<20} {n:>7} {p50:10.2f} {p90:10.2f} {p99:10.2f} {high:10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
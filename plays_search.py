@@ -0,0 +1,285 @@
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Name under which the search index is cached on each snapshot
+SEARCH_INDEX = "search"
+
+SEARCH_FIELDS = ["Title_Marathi", "Title_English", "Author_Marathi", "Author_English"]
+AUTHOR_FIELDS = ["Author_Marathi", "Author_English"]
+TITLE_FIELDS = ["Title_Marathi", "Title_English"]
+
+# Rows edited since the last full build are kept in a small overlay; past this
+# size the index is rebuilt.
+MAX_OVERLAY = 5000
+
+NUKTA = "़"
+VIRAMA = "्"
+
+DEVANAGARI_VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ru",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ॲ": "a", "ऑ": "o", "ऍ": "e",
+}
+DEVANAGARI_SIGNS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ru",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॅ": "e", "ॉ": "o",
+}
+DEVANAGARI_CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "श": "sh",
+    "ष": "sh", "स": "s", "ह": "h", "ळ": "l",
+}
+# Anusvara and chandrabindu both fold to a plain nasal, visarga to "h"
+DEVANAGARI_MARKS = {"ं": "n", "ँ": "n", "ः": "h", "ऽ": ""}
+DEVANAGARI_DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+# Spelling variants that Romanized Marathi uses interchangeably. None of them
+# matches across a line break, so they can run over many keys joined by "\n".
+ROMAN_FOLDS = [
+    (re.compile(r"[^a-z0-9 \n]+"), " "),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"z"), "j"),
+    (re.compile(r"q"), "k"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"f"), "p"),
+    (re.compile(r"sh"), "s"),
+    (re.compile(r"ch"), "c"),
+    (re.compile(r"([kgcjtdpbs])h"), r"\1"),
+    (re.compile(r"ee|ii"), "i"),
+    (re.compile(r"oo|uu"), "u"),
+    (re.compile(r"(.)\1+"), r"\1"),
+    (re.compile(r" +"), " "),
+]
+
+
+# NFC, lower case, with the nukta dropped so that e.g. "ज़" and "ज" compare equal
+def normalize_text(text):
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFC", text).lower()
+    text = unicodedata.normalize("NFD", text).replace(NUKTA, "")
+    return unicodedata.normalize("NFC", text).strip()
+
+
+# Romanize Devanagari text with an inherent "a" after each consonant that is
+# not followed by a vowel sign or virama, dropped at the end of a word.
+def transliterate(text):
+    if text.isascii():
+        return text
+    out = []
+    chars = unicodedata.normalize("NFD", text)
+    for i, ch in enumerate(chars):
+        if ch in DEVANAGARI_CONSONANTS:
+            out.append(DEVANAGARI_CONSONANTS[ch])
+            nxt = chars[i + 1] if i + 1 < len(chars) else ""
+            if nxt == NUKTA and i + 2 < len(chars):
+                nxt = chars[i + 2]
+            if nxt not in DEVANAGARI_SIGNS and nxt != VIRAMA and ("ऀ" <= nxt <= "ॿ"):
+                out.append("a")
+        elif ch in DEVANAGARI_SIGNS:
+            out.append(DEVANAGARI_SIGNS[ch])
+        elif ch in DEVANAGARI_VOWELS:
+            out.append(DEVANAGARI_VOWELS[ch])
+        elif ch in DEVANAGARI_MARKS:
+            out.append(DEVANAGARI_MARKS[ch])
+        elif ch in DEVANAGARI_DIGITS:
+            out.append(DEVANAGARI_DIGITS[ch])
+        elif ch in (VIRAMA, NUKTA):
+            continue
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+# Transliterated, diacritic-free, lower-case text, on one line
+def _prepare(text):
+    text = transliterate(normalize_text(text))
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return text.lower().replace("\n", " ")
+
+
+def _fold(text):
+    for pattern, repl in ROMAN_FOLDS:
+        text = pattern.sub(repl, text)
+    return text.replace("aa", "a")
+
+
+# Script-independent search key: Devanagari is transliterated, Latin
+# diacritics are stripped and common Romanization variants are folded, so
+# "सगळे उभे आहेत", "Sagale Ubhe Aahet" and "Sagle Ubhe Ahet" end up close.
+def search_key(text):
+    return _fold(_prepare(text)).strip()
+
+
+# search_key of every value in a column, as an object array. Each distinct
+# value is prepared once and the folds run once over all of them joined
+# into a single string.
+def search_keys(values):
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    keys = np.full(len(codes), "", dtype=object)
+    if len(uniques):
+        folded = _fold("\n".join(_prepare(value) for value in uniques)).split("\n")
+        folded = np.array([key.strip() for key in folded], dtype=object)
+        known = codes >= 0
+        keys[known] = folded[codes[known]]
+    return keys
+
+
+def trigrams(key):
+    if not key:
+        return set()
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# The trigrams of many keys at once, as integer codes (three code points of
+# 21 bits each): (codes, position in `keys` of each code). A key's trigrams
+# may repeat. Keys hold no NUL, which separates them here.
+def trigram_codes(keys):
+    text = "\0".join(f" {key} " for key in keys)
+    points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(points) < 3:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    lengths = np.fromiter((len(key) + 3 for key in keys), dtype=np.int64, count=len(keys))
+    owner = np.repeat(np.arange(len(keys)), lengths)[:len(points) - 2]
+    first, second, third = points[:-2], points[1:-1], points[2:]
+    valid = (first != 0) & (second != 0) & (third != 0)
+    return ((first << 42) | (second << 21) | third)[valid], owner[valid]
+
+
+# Trigram codes back to strings
+def trigram_text(codes):
+    mask = (1 << 21) - 1
+    points = np.stack([codes >> 42, (codes >> 21) & mask, codes & mask], axis=1).astype(np.uint32)
+    text = points.tobytes().decode("utf-32-le")
+    return [text[i:i + 3] for i in range(0, len(text), 3)]
+
+
+# Inverted index {trigram: row positions} over one column of keys. Each
+# distinct key is split into trigrams once, then its (trigram, key) pairs
+# are expanded to the rows holding that key, all in numpy.
+def postings_of(keys):
+    codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+    grams, owner = trigram_codes(list(uniques))
+    if not len(grams):
+        return {}
+    order = np.lexsort((owner, grams))
+    grams, owner = grams[order], owner[order]
+    first = np.ones(len(grams), dtype=bool)
+    first[1:] = (grams[1:] != grams[:-1]) | (owner[1:] != owner[:-1])
+    grams, owner = grams[first], owner[first]
+    # Rows of each distinct key, grouped by key
+    counts = np.bincount(codes, minlength=len(uniques))
+    key_rows = np.argsort(codes, kind="stable")
+    key_start = np.cumsum(counts) - counts
+    lengths = counts[owner]
+    pair = np.repeat(np.arange(len(owner)), lengths)
+    within = np.arange(len(pair)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    rows = key_rows[key_start[owner][pair] + within]
+    grams = grams[pair]
+    bounds = np.flatnonzero(np.diff(grams)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(grams)]])
+    return {gram: rows[start:end] for gram, start, end in zip(trigram_text(grams[starts]), starts, ends)}
+
+
+# Trigram inverted index over the title and author columns. The bulk of the
+# postings live in numpy arrays of row positions built once (postings_of);
+# rows added or edited later go to a small overlay so updates do not rebuild
+# the index.
+class PlaySearchIndex:
+    def __init__(self, df):
+        self._lock = threading.Lock()
+        self._build({field: search_keys(df[field]) for field in SEARCH_FIELDS})
+
+    def _build(self, keys):
+        self.keys = keys
+        self.size = len(next(iter(keys.values()))) if keys else 0
+        self.postings = {}
+        for field, field_keys in keys.items():
+            self.postings[field] = postings_of(field_keys)
+        # Rows whose entries in the arrays above are out of date, and their
+        # current trigrams per field
+        self.stale = np.zeros(self.size, dtype=bool)
+        self.overlay = {}
+
+    # Apply a data change in place: the index is shared by consecutive
+    # versions, which only ever append rows, so older snapshots stay valid.
+    def updated(self, df, change):
+        rows = list(change.get("updated", [])) + list(change.get("appended", []))
+        with self._lock:
+            if len(df) > self.size:
+                grow = len(df) - self.size
+                self.stale = np.concatenate([self.stale, np.ones(grow, dtype=bool)])
+                for field in SEARCH_FIELDS:
+                    self.keys[field] = np.concatenate([self.keys[field], np.full(grow, "", dtype=object)])
+                self.size = len(df)
+            for row in rows:
+                self.stale[row] = True
+                grams = {}
+                for field in SEARCH_FIELDS:
+                    key = search_key(df[field].iat[row])
+                    self.keys[field][row] = key
+                    grams[field] = trigrams(key)
+                self.overlay[row] = grams
+            if len(self.overlay) > MAX_OVERLAY:
+                self._build(self.keys)
+        return self
+
+    def _field_scores(self, field, grams, query_key, size):
+        counts = np.zeros(size, dtype=np.float32)
+        if not grams:
+            # Too short for trigrams: fall back to a substring scan of the keys
+            keys = self.keys[field][:size]
+            hit = np.fromiter((query_key in key for key in keys), dtype=bool, count=len(keys))
+            counts[:len(hit)] = hit
+            return counts
+        postings = self.postings[field]
+        hits = [postings[gram] for gram in grams if gram in postings]
+        if hits:
+            counts += np.bincount(np.concatenate(hits), minlength=size)[:size]
+        n = min(size, self.size)
+        counts[:n][self.stale[:n]] = 0
+        for row, row_grams in self.overlay.items():
+            if row < size:
+                counts[row] = len(grams & row_grams[field])
+        return counts / len(grams)
+
+    # Score every row against `query` (0..1, share of the query's trigrams
+    # found in the best matching field) for the first `size` rows.
+    def scores(self, query, fields=None, size=None):
+        size = self.size if size is None else size
+        query_key = search_key(query)
+        grams = trigrams(query_key) if len(query_key) >= 3 else set()
+        best = np.zeros(size, dtype=np.float32)
+        if not query_key:
+            return best
+        with self._lock:
+            for field in fields or SEARCH_FIELDS:
+                np.maximum(best, self._field_scores(field, grams, query_key, size), out=best)
+        return best
+
+    # Ranked fuzzy matches: (positions, scores), best first
+    def search(self, query, fields=None, size=None, min_score=0.5, limit=None):
+        scores = self.scores(query, fields, size)
+        rows = np.flatnonzero(scores >= min_score)
+        order = np.argsort(-scores[rows], kind="stable")
+        rows = rows[order][:limit]
+        return rows, scores[rows]
+
+
+def search_index(snapshot):
+    return snapshot.derived(SEARCH_INDEX, PlaySearchIndex)
+
+
+# Ranked matches for `query` in one snapshot: (positions, scores)
+def search_plays(snapshot, query, fields=None, min_score=0.5, limit=None):
+    return search_index(snapshot).search(query, fields, len(snapshot.df), min_score, limit)
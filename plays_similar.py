@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from plays_filter import genre_bits, property_codes
+from plays_ids import id_index
+from plays_store import GENRE_OPTIONS, PROPERTY_OPTIONS
+
+# Name under which the similarity index is cached on each snapshot
+SIMILAR_INDEX = "similar"
+
+# Plays listed under "Plays like this"
+TOP_K = 10
+# Neighbour lists kept per snapshot, least recently used dropped first
+CACHE_SIZE = 10000
+
+# Numeric features with the value the "Add a New Play" form stores when the
+# field is left alone; those count as unknown. Era falls back to the year of
+# writing when the first performance year is unknown.
+NUMERIC_FEATURES = {
+    "acts": ("Number of Acts", 0),
+    "length": ("Length", 1),
+    "male": ("Male Characters", 0),
+    "female": ("Female Characters", 0),
+    "era": ("First Performance Year", 1500),
+}
+
+# Weight of each block of features in the similarity
+WEIGHTS = {"genre": 1.0, "acts": 1.0, "length": 0.5, "male": 1.0, "female": 1.0, "property": 0.5, "era": 0.75}
+
+
+def _numeric(df, name):
+    col, unknown = NUMERIC_FEATURES[name]
+    values = df[col].to_numpy(dtype=float).copy()
+    values[values <= unknown] = np.nan
+    if name == "era":
+        written = df["Year of Writing"].to_numpy(dtype=float)
+        fallback = np.isnan(values) & (written > 1500)
+        values[fallback] = written[fallback]
+    return values
+
+
+# Feature matrix of the plays: multi-hot genres, one-hot Property and the
+# numeric fields as z-scores (unknown values are 0, i.e. neutral), weighted
+# by block and scaled to unit length so that a dot product is the cosine
+# similarity. `scales` holds (mean, std) per numeric feature, so rows added
+# later are scaled like the rest.
+def feature_matrix(df, scales):
+    n = len(df)
+    bits = genre_bits(df["Genre"])
+    genres = ((bits[:, None] >> np.arange(len(GENRE_OPTIONS), dtype=np.uint16)) & 1).astype(np.float32)
+    genres *= WEIGHTS["genre"]
+    codes = property_codes(df["Property"])
+    prop = np.zeros((n, len(PROPERTY_OPTIONS) + 1), dtype=np.float32)
+    prop[np.arange(n), codes] = WEIGHTS["property"]
+    prop[:, PROPERTY_OPTIONS.index("Unknown")] = 0  # unknown says nothing
+    numeric = np.zeros((n, len(NUMERIC_FEATURES)), dtype=np.float32)
+    for i, name in enumerate(NUMERIC_FEATURES):
+        mean, std = scales[name]
+        z = np.clip((_numeric(df, name) - mean) / std, -3, 3)
+        numeric[:, i] = np.nan_to_num(z) * WEIGHTS[name]
+    matrix = np.hstack([genres, prop, numeric])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def feature_scales(df):
+    scales = {}
+    for name in NUMERIC_FEATURES:
+        values = _numeric(df, name)
+        known = values[~np.isnan(values)]
+        std = float(known.std()) if len(known) > 1 else 0.0
+        scales[name] = (float(known.mean()) if len(known) else 0.0, std if std > 0 else 1.0)
+    return scales
+
+
+# Nearest neighbours by cosine similarity over one snapshot. A lookup is one
+# matrix-vector product and an argpartition; results are cached per play.
+# On add and save only the changed rows are re-featurized, and a cached list
+# is recomputed only if the play itself changed or a changed play now ranks
+# among its neighbours.
+class SimilarIndex:
+    def __init__(self, df, scales=None):
+        self.scales = scales or feature_scales(df)
+        self.matrix = feature_matrix(df, self.scales)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def updated(self, df, change):
+        updated = [row for row in change.get("updated", []) if row < len(self.matrix)]
+        rows = updated + list(change.get("appended", []))
+        new = SimilarIndex.__new__(SimilarIndex)
+        new.scales = self.scales
+        new._lock = threading.Lock()
+        matrix = np.zeros((len(df), self.matrix.shape[1]), dtype=np.float32)
+        keep = min(len(self.matrix), len(df))
+        matrix[:keep] = self.matrix[:keep]
+        if rows:
+            matrix[rows] = feature_matrix(df.iloc[rows], self.scales)
+        new.matrix = matrix
+        with self._lock:
+            cache = OrderedDict(self._cache)
+        if rows and cache:
+            sources = np.fromiter(cache, dtype=np.int64, count=len(cache))
+            sims = matrix[sources] @ matrix[rows].T
+            changed = set(rows)
+            for source, row_sims in zip(sources.tolist(), sims):
+                neighbours, scores = cache[source]
+                floor = scores[-1] if len(scores) else -np.inf
+                if source in changed or changed.intersection(neighbours.tolist()) or (row_sims > floor).any():
+                    del cache[source]
+        new._cache = cache
+        return new
+
+    # Rows of the `k` plays most like the one at `row`, best first, and their
+    # cosine similarities
+    def neighbours(self, row, k=TOP_K):
+        with self._lock:
+            hit = self._cache.get(row)
+            if hit is not None and len(hit[0]) >= min(k, len(self.matrix) - 1):
+                self._cache.move_to_end(row)
+                return hit[0][:k], hit[1][:k]
+        sims = self.matrix @ self.matrix[row]
+        sims[row] = -np.inf
+        count = min(k, len(sims) - 1)
+        if count <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        top = np.argpartition(sims, len(sims) - count)[-count:]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        result = (top, sims[top])
+        with self._lock:
+            self._cache[row] = result
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+
+def similar_index(snapshot):
+    return snapshot.derived(SIMILAR_INDEX, SimilarIndex)
+
+
+# Plays most like the play with `play_id` in one snapshot: (positions,
+# similarities), best first
+def similar_plays(snapshot, play_id, k=TOP_K):
+    row = id_index(snapshot).row(play_id)
+    if row is None or row >= len(snapshot.df):
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+    return similar_index(snapshot).neighbours(row, k)
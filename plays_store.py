@@ -0,0 +1,369 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from plays_perf import span
+
+# File to persist the data
+CSV_FILE = "plays.csv"
+
+# Low-cardinality text columns kept as pandas categoricals
+CATEGORICAL_COLUMNS = ["Property", "Availability", "Submitted By"]
+
+# Stable identifier of a play, assigned once and never reused
+ID_COLUMN = "Play ID"
+
+# Bumped on every saved edit of a row; used to detect conflicting edits
+VERSION_COLUMN = "Row Version"
+
+# Columns shown and edited by the app, in display order
+PLAY_COLUMNS = [
+    "Title_Marathi", "Author_Marathi",
+    "Title_English", "Author_English",
+    "Length", "Number of Acts", "Genre",
+    "First Performance Year", "Submitted By", "Male Characters", "Female Characters",
+    "Pages", "Property", "Year of Writing", "Availability", "YouTube", "Certified By"
+]
+
+NUMERIC_COLUMNS = [
+    "First Performance Year", "Number of Acts", "Length",
+    "Male Characters", "Female Characters", "Pages", "Year of Writing"
+]
+
+# Allowed values for the fields edited with checkboxes and radio buttons
+GENRE_OPTIONS = ["Comedy", "Drama", "Farce", "Historical", "Musical", "Romance", "Satire", "Sci-Fi", "Tragedy", "Other"]
+ACT_OPTIONS = [1, 1.5, 2, 3, 4, 0]
+PROPERTY_OPTIONS = ["Unknown", "No property", "Minimal", "Extensive", "Different acts"]
+AVAILABILITY_OPTIONS = ["Print", "Abhivyakti", "CALAA", "NULL"]
+
+# Fields that must be filled in for every play
+REQUIRED_COLUMNS = ["Title_Marathi", "Title_English", "Author_Marathi", "Author_English", "Certified By"]
+
+STRING_DTYPES = {
+    "Genre": str,
+    "Submitted By": str,
+    "Property": str,
+    "Availability": str,
+    "YouTube": str,
+    "Certified By": str
+}
+
+# Dummy data used if the CSV doesn't exist
+DUMMY_PLAYS = [
+    {
+        "Title_Marathi": "नाटक 1",
+        "Title_English": "Play 1",
+        "Author_Marathi": "लेखक अ",
+        "Author_English": "Author A",
+        "Length": 120,
+        "Number of Acts": 3,
+        "Genre": "Drama",
+        "First Performance Year": 1990,
+        "Submitted By": "",
+        "Male Characters": 0,
+        "Female Characters": 0,
+        "Pages": 0,
+        "Property": "",
+        "Year of Writing": 0,
+        "Availability": "",
+        "YouTube": "",
+        "Certified By": ""
+    }
+]
+
+
+# Convert numeric columns appropriately. This runs once when the CSV is parsed
+# (and on newly added rows), never on every rerun.
+def coerce_types(df):
+    with span("coerce", rows=len(df)):
+        for col in NUMERIC_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        df["Genre"] = df["Genre"].fillna("").astype(str)
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("category")
+    return df
+
+
+# Compulsory fields left empty in a new play
+def missing_required(entry):
+    return [col for col in REQUIRED_COLUMNS if not str(entry.get(col) or "").strip()]
+
+
+# "NULL" only stands on its own: drop it when any real source is selected
+def normalize_availability(selected):
+    selected = list(selected)
+    if "NULL" in selected and len(selected) > 1:
+        selected.remove("NULL")
+    return selected
+
+
+# Coerce a single edited value to the type of its column
+def coerce_value(col, value):
+    if col in NUMERIC_COLUMNS:
+        return pd.to_numeric(pd.Series([value]), errors="coerce").iloc[0]
+    if col == "Genre" and not isinstance(value, str):
+        return ""
+    return value
+
+
+# Set one cell, growing the categories of a categorical column if needed
+def set_value(df, row_idx, col, value):
+    value = coerce_value(col, value)
+    if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+        if not pd.isna(value) and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+    df.at[row_idx, col] = value
+
+
+# Typed columnar copy of the CSV, kept next to it (plays.csv -> plays.feather)
+def snapshot_path(csv_file):
+    return os.path.splitext(csv_file)[0] + ".feather"
+
+
+def read_snapshot(path):
+    from pyarrow import feather
+    # Uncompressed and memory-mapped, so loading does not parse anything
+    with span("read_snapshot"):
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def write_snapshot(df, path):
+    from pyarrow import feather
+    tmp_path = path + ".tmp"
+    feather.write_feather(df, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+# Give every play without one a Play ID (the first column), continuing after
+# the highest existing ID, and a Row Version
+def assign_play_ids(df):
+    if ID_COLUMN not in df.columns:
+        df.insert(0, ID_COLUMN, range(1, len(df) + 1))
+    ids = pd.to_numeric(df[ID_COLUMN], errors="coerce")
+    missing = ids.isna()
+    if missing.any():
+        start = int(ids.max()) + 1 if not missing.all() else 1
+        ids[missing] = range(start, start + int(missing.sum()))
+    df[ID_COLUMN] = ids.astype("int64")
+    if VERSION_COLUMN not in df.columns:
+        df[VERSION_COLUMN] = 1
+    df[VERSION_COLUMN] = pd.to_numeric(df[VERSION_COLUMN], errors="coerce").fillna(1).astype("int64")
+    return df
+
+
+def parse_csv(csv_file):
+    with span("read_csv"):
+        df = pd.read_csv(csv_file, dtype=STRING_DTYPES)
+    return coerce_types(df)
+
+
+# (modification time, size) of a file, or None if there is none
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Load from the typed snapshot when it is at least as new as the CSV, else
+# parse the CSV and rebuild the snapshot. With `write_cache` off nothing is
+# written (for read-only processes such as the API).
+def load_plays(csv_file=CSV_FILE, write_cache=True):
+    if not os.path.exists(csv_file):
+        df = assign_play_ids(pd.DataFrame(DUMMY_PLAYS))
+        if write_cache:
+            df.to_csv(csv_file, index=False)
+        return coerce_types(df)
+    path = snapshot_path(csv_file)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv_file):
+        try:
+            return assign_play_ids(read_snapshot(path))
+        except Exception:
+            pass  # unreadable snapshot: rebuild it below
+    df = assign_play_ids(parse_csv(csv_file))
+    if write_cache:
+        try:
+            write_snapshot(df, path)
+        except Exception:
+            pass  # the snapshot is only a cache
+    return df
+
+
+# Values of a column as an object array, with every missing value as ""
+def _comparable(values):
+    values = values.astype(object)
+    return values.where(values.notna(), "").to_numpy()
+
+
+# The change turning `old` into `new` ({"updated": [...], "appended": [...]}
+# row positions, as apply_batch publishes it) when `new` holds the plays of
+# `old` in the same order, possibly edited, followed by new ones; None when
+# plays were removed or reordered. A missing value and "" count as equal.
+def diff_plays(old, new):
+    if len(new) < len(old) or set(new.columns) != set(old.columns):
+        return None
+    if not np.array_equal(new[ID_COLUMN].to_numpy()[:len(old)], old[ID_COLUMN].to_numpy()):
+        return None
+    head = new.iloc[:len(old)]
+    changed = np.zeros(len(old), dtype=bool)
+    for col in old.columns:
+        changed |= _comparable(old[col]) != _comparable(head[col])
+    return {"updated": np.flatnonzero(changed).tolist(), "appended": list(range(len(old), len(new)))}
+
+
+# An immutable view of the plays data at one version. Indexes derived from the
+# data (filters, search, ...) are built once per snapshot and shared by every
+# session looking at that version.
+class PlaysSnapshot:
+    def __init__(self, df, version, change=None, previous=None):
+        self.df = df
+        self.version = version
+        self.change = change or {}
+        self._previous = previous
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    # Return the derived object registered under `name`, building it on first
+    # use. If the previous version already had one that knows how to apply a
+    # change (an `updated(df, change)` method), it is carried forward
+    # incrementally instead of being rebuilt from scratch.
+    def derived(self, name, builder):
+        obj = self._derived.get(name)
+        if obj is not None:
+            return obj
+        with self._lock:
+            obj = self._derived.get(name)
+            if obj is None:
+                prev = self._previous._derived.get(name) if self._previous is not None else None
+                if prev is not None and hasattr(prev, "updated"):
+                    obj = prev.updated(self.df, self.change)
+                else:
+                    obj = builder(self.df)
+                self._derived[name] = obj
+            return obj
+
+    # Carry every index of the previous version forward onto this one. Done
+    # at publish time, so a run of versions published with no read in between
+    # (a writer batch, a log replay) keeps the indexes warm.
+    def _carry_forward(self):
+        with self._previous._lock:
+            derived = dict(self._previous._derived)
+        for name, obj in derived.items():
+            if hasattr(obj, "updated"):
+                self._derived[name] = obj.updated(self.df, self.change)
+
+
+# Process-wide, versioned holder of the plays DataFrame. Sessions only keep a
+# version number; edits publish a new read-only snapshot (copy-on-write) which
+# every other session picks up on its next rerun.
+class PlaysStore:
+    def __init__(self, csv_file=CSV_FILE, write_cache=True):
+        self.csv_file = csv_file
+        self.write_cache = write_cache
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._next_id = 1
+        self._snapshot = None
+        self.reload()
+
+    # True if the CSV was rewritten (by another process) since this store
+    # last loaded or saved it
+    def csv_changed(self):
+        return file_stamp(self.csv_file) != self.csv_stamp
+
+    # Load the CSV afresh and publish it as a new version. Indexes are built
+    # anew, since the rows may have nothing to do with the previous version.
+    def reload(self):
+        with self._lock:
+            # Stamped before reading: a rewrite in between shows as a change
+            self.csv_stamp = file_stamp(self.csv_file)
+            df = load_plays(self.csv_file, self.write_cache)
+            if self.csv_stamp is None:
+                self.csv_stamp = file_stamp(self.csv_file)
+            ids = df[ID_COLUMN]
+            self._next_id = max(self._next_id, int(ids.max()) + 1 if len(ids) else 1)
+            self._snapshot = PlaysSnapshot(df, self._snapshot.version + 1 if self._snapshot else 1)
+            return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    @property
+    def df(self):
+        return self._snapshot.df
+
+    def current(self):
+        return self._snapshot
+
+    def publish(self, df, change=None):
+        with self._lock:
+            prev = self._snapshot
+            # Only the immediately previous snapshot is kept as the base for
+            # incremental index updates, so old versions can be freed.
+            prev._previous = None
+            snapshot = PlaysSnapshot(df, prev.version + 1, change, prev)
+            snapshot._carry_forward()
+            self._snapshot = snapshot
+            return snapshot
+
+    # Apply a batch of edits and new plays and publish the result as one new
+    # version. `updates` is a list of (row position, {column: value}); each
+    # edited row gets its Row Version bumped. New plays get a fresh Play ID
+    # unless they already carry one.
+    def apply_batch(self, updates=(), rows=()):
+        with self._lock:
+            df = self._snapshot.df
+            change = {}
+            if len(updates):
+                df = df.copy()
+                for row_idx, values in updates:
+                    for key, value in values.items():
+                        set_value(df, row_idx, key, value)
+                    df.at[row_idx, VERSION_COLUMN] += 1
+                change["updated"] = sorted({row_idx for row_idx, _ in updates})
+            if len(rows):
+                new_rows = coerce_types(pd.DataFrame(rows))
+                if ID_COLUMN not in new_rows.columns:
+                    new_rows[ID_COLUMN] = pd.NA
+                missing = new_rows[ID_COLUMN].isna().to_numpy()
+                new_rows.loc[missing, ID_COLUMN] = range(self._next_id, self._next_id + int(missing.sum()))
+                new_rows[ID_COLUMN] = new_rows[ID_COLUMN].astype("int64")
+                self._next_id = max(self._next_id, int(new_rows[ID_COLUMN].max()) + 1)
+                new_rows[VERSION_COLUMN] = 1
+                merged = pd.concat([df, new_rows], ignore_index=True)
+                for col in CATEGORICAL_COLUMNS:
+                    if col in merged.columns:
+                        merged[col] = merged[col].astype("category")
+                change["appended"] = list(range(len(df), len(merged)))
+                df = merged
+            return self.publish(df, change)
+
+    # Apply edited values to one row and publish the result
+    def update_row(self, row_idx, values):
+        return self.apply_batch(updates=[(row_idx, values)])
+
+    # Append new plays, each under a fresh Play ID, and publish the result
+    def append_rows(self, rows):
+        return self.apply_batch(rows=rows)
+
+    # Write the current version to the CSV (and the typed snapshot). The file
+    # is replaced atomically, so readers never see a half-written CSV.
+    def save(self):
+        with self._save_lock:
+            df = self._snapshot.df
+            tmp_file = self.csv_file + ".tmp"
+            with span("to_csv", rows=len(df)):
+                df.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, self.csv_file)
+            self.csv_stamp = file_stamp(self.csv_file)
+            try:
+                write_snapshot(df, snapshot_path(self.csv_file))
+            except Exception:
+                pass
+            return df
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the log is only locked within this process
+    fcntl = None
+
+import pandas as pd
+
+from plays_ids import id_index
+from plays_store import ID_COLUMN, VERSION_COLUMN
+
+logger = logging.getLogger("plays.writer")
+
+# How long the writer keeps collecting changes after the first one arrives
+BATCH_WINDOW = 0.05
+# Compact (rewrite the CSV and clear the change log) after this many logged
+# changes, or after the writer has been idle this many seconds
+COMPACT_EVERY = 500
+COMPACT_IDLE = 5.0
+
+
+class ConflictError(Exception):
+    # Raised for an edit based on an outdated Row Version; `current` holds the
+    # play's values as they are now.
+    def __init__(self, play_id, current):
+        super().__init__(f"Play {play_id} was changed by someone else")
+        self.play_id = play_id
+        self.current = current
+
+
+def change_log_path(csv_file):
+    return os.path.splitext(csv_file)[0] + ".changes.jsonl"
+
+
+def _json_value(value):
+    if not isinstance(value, str) and pd.isna(value):
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    return value
+
+
+def _insert_record(play_id, row):
+    return {"op": "insert", "id": play_id, "values": {k: _json_value(v) for k, v in row.items()}}
+
+
+def _update_record(play_id, version, values):
+    return {"op": "update", "id": play_id, "version": version,
+            "values": {k: _json_value(v) for k, v in values.items()}}
+
+
+# The change log of one CSV, shared by every process that changes the plays:
+# the app's writer and the import command line. Appends and compactions
+# happen under an exclusive lock on the file, and each process first applies
+# what the others appended since it last looked, so a compaction never
+# rewrites the CSV without someone else's changes.
+class ChangeLog:
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0  # bytes of the log already applied to our store
+
+    @contextmanager
+    def locked(self):
+        with open(self.path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield f
+
+    # Apply the whole lines appended after `offset` to `store`; returns how
+    # many changes that was. If someone else compacted in the meantime, the
+    # store is reloaded from the rewritten CSV first, so it never hands out
+    # Play IDs that are already taken.
+    def catch_up(self, f, store):
+        f.seek(0, os.SEEK_END)
+        if store.csv_changed():
+            store.reload()
+            self.offset = 0
+        if f.tell() < self.offset:
+            self.offset = 0  # cleared since
+        if f.tell() == self.offset:
+            return 0
+        f.seek(self.offset)
+        data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        records = read_changes(complete.decode("utf-8").splitlines())
+        apply_changes(store, records)
+        self.offset += len(complete)
+        return len(records)
+
+    def append(self, f, records):
+        f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        self.offset = f.tell()
+
+    def clear(self, f):
+        f.truncate(0)
+        f.flush()
+        os.fsync(f.fileno())
+        self.offset = 0
+
+    # Add new plays to `store` and to the log in one step, for a process
+    # without a PlaysWriter; the running app's writer picks them up from the
+    # log and folds them into the CSV. Returns their IDs.
+    def insert(self, store, rows):
+        if hasattr(rows, "to_dict"):
+            rows = rows.to_dict("records")
+        with self.locked() as f:
+            self.catch_up(f, store)
+            start = len(store.df)
+            new_ids = store.append_rows(rows).df[ID_COLUMN].iloc[start:].tolist()
+            self.append(f, [_insert_record(play_id, row) for play_id, row in zip(new_ids, rows)])
+        return new_ids
+
+
+# Single background writer for a PlaysStore. Sessions queue row-level changes
+# and get a Future back; the writer applies whatever is queued as one batch
+# (one new data version), appends it to a change log and only rewrites the
+# CSV when compacting. Saves therefore cost about the same whatever the size
+# of the catalogue, and edits based on a stale Row Version are rejected with
+# ConflictError instead of overwriting someone else's change.
+class PlaysWriter:
+    def __init__(self, store, log_file=None, batch_window=BATCH_WINDOW,
+                 compact_every=COMPACT_EVERY, compact_idle=COMPACT_IDLE):
+        self.store = store
+        self.log_file = log_file or change_log_path(store.csv_file)
+        self.log = ChangeLog(self.log_file)
+        self.batch_window = batch_window
+        self.compact_every = compact_every
+        self.compact_idle = compact_idle
+        self._queue = queue.Queue()
+        self._logged = 0
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name="plays-writer", daemon=True)
+        self._thread.start()
+
+    # Queue an edit of one play made on top of `base_version`; the Future
+    # resolves to the play's new Row Version, and its `data_version` is the
+    # store version the edit was published in
+    def submit_update(self, play_id, values, base_version):
+        return self._submit(("update", (int(play_id), dict(values), int(base_version))))
+
+    # Queue new plays (dicts or a DataFrame); the Future resolves to their IDs
+    def submit_insert(self, rows):
+        if hasattr(rows, "to_dict"):
+            rows = rows.to_dict("records")
+        return self._submit(("insert", list(rows)))
+
+    # Queue a compaction; the Future resolves once the CSV is rewritten
+    def compact(self):
+        return self._submit(("compact", None))
+
+    def _submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.compact_idle)]
+            except queue.Empty:
+                # Also folds in changes other processes logged meanwhile. A
+                # failure (disk full, a bad log line) is retried next time
+                # rather than ending the thread.
+                try:
+                    with self.log.locked() as f:
+                        self._logged += self.log.catch_up(f, self.store)
+                        if self._logged:
+                            self._compact(f)
+                except Exception:
+                    logger.exception("Compacting the change log failed")
+                continue
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _apply(self, batch):
+        with self.log.locked() as f:
+            self._logged += self.log.catch_up(f, self.store)
+            self._apply_batch(f, batch)
+
+    def _apply_batch(self, f, batch):
+        snapshot = self.store.current()
+        df = snapshot.df
+        ids = id_index(snapshot)
+        updates, update_futures, inserts, insert_futures, compacts = [], [], [], [], []
+        pending = {}  # Row Version after the edits already in this batch
+        for (kind, payload), future in batch:
+            if kind == "update":
+                play_id, values, base_version = payload
+                row = ids.row(play_id)
+                if row is None:
+                    future.set_exception(KeyError(f"No play with ID {play_id}"))
+                    continue
+                current_version = pending.get(row, int(df[VERSION_COLUMN].iat[row]))
+                if current_version != base_version:
+                    future.set_exception(ConflictError(play_id, df.iloc[row].to_dict()))
+                    continue
+                pending[row] = current_version + 1
+                updates.append((row, values))
+                update_futures.append((future, play_id, base_version + 1))
+            elif kind == "insert":
+                start = len(inserts)
+                inserts.extend(payload)
+                insert_futures.append((future, start, len(inserts)))
+            else:
+                compacts.append(future)
+
+        records = []
+        if updates or inserts:
+            published = self.store.apply_batch(updates, inserts)
+            new_ids = published.df[ID_COLUMN].iloc[len(df):].tolist()
+            for (_, values), (_, play_id, version) in zip(updates, update_futures):
+                records.append(_update_record(play_id, version, values))
+            for row, play_id in zip(inserts, new_ids):
+                records.append(_insert_record(play_id, row))
+            self.log.append(f, records)
+            self._logged += len(records)
+            # Lets a session tell its own change from someone else's
+            for future, _, _ in update_futures + insert_futures:
+                future.data_version = published.version
+            for future, play_id, version in update_futures:
+                future.set_result(version)
+            for future, start, end in insert_futures:
+                future.set_result(new_ids[start:end])
+
+        if compacts or self._logged >= self.compact_every:
+            self._compact(f)
+        for future in compacts:
+            future.set_result(None)
+
+    # Rewrite the CSV atomically from the current version, then clear the
+    # log; `f` is the locked log, already caught up
+    def _compact(self, f):
+        self.store.save()
+        self.log.clear(f)
+        self._logged = 0
+
+    # Re-apply changes logged after the last compaction (e.g. before a
+    # restart, or by another process), then fold them into the CSV
+    def _replay(self):
+        if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+            return
+        with self.log.locked() as f:
+            if self.log.catch_up(f, self.store):
+                self._compact(f)
+
+
+# Change-log records from an open file (from its current position on) or a
+# list of lines
+def read_changes(f):
+    return [json.loads(line) for line in f if line.strip()]
+
+
+# Apply change-log records to a store. Inserts already in the store are
+# skipped; updates set the same values again and the Row Version the edit
+# produced, so replaying is safe after a partial compaction.
+def apply_changes(store, records):
+    updates, inserts = [], []
+    ids = id_index(store.current())
+    for record in records:
+        if record["op"] == "insert":
+            if ids.row(record["id"]) is None:
+                inserts.append(dict(record["values"], **{ID_COLUMN: record["id"]}))
+        else:
+            updates.append(record)
+    if inserts:
+        store.apply_batch(rows=inserts)
+        ids = id_index(store.current())
+    batch = []
+    for record in updates:
+        row = ids.row(record["id"])
+        if row is not None:
+            # apply_batch bumps the Row Version once more
+            batch.append((row, dict(record["values"], **{VERSION_COLUMN: record["version"] - 1})))
+    if batch:
+        store.apply_batch(updates=batch)
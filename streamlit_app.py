@@ -1,398 +1,583 @@
-import streamlit as st
+import concurrent.futures
+import io
+import threading
+import uuid
+from contextlib import contextmanager
+
 import pandas as pd
-import os
+import streamlit as st
+
+from plays_dedupe import dedupe_index
+from plays_export import EXPORT_FORMATS, write_export
+from plays_facets import facet_counts, histogram
+from plays_filter import filter_plays, query_index
+from plays_grid import DEFAULT_SORT, PAGE_SIZES, page_count, page_frame, sort_positions
+from plays_ids import id_index, play_details
+from plays_import import import_plays
+from plays_perf import RunTimer, log_run, session_bytes, span
+from plays_search import search_index
+from plays_similar import similar_plays
+from plays_store import ACT_OPTIONS, AVAILABILITY_OPTIONS, CSV_FILE, GENRE_OPTIONS, ID_COLUMN, PLAY_COLUMNS, PROPERTY_OPTIONS, VERSION_COLUMN, PlaysStore, missing_required, normalize_availability
+from plays_writer import ConflictError, PlaysWriter
 
 # File to persist the data
-csv_file = "plays.csv"
-
-# Load or initialize the DataFrame
-if "df" not in st.session_state:
-    if os.path.exists(csv_file):
-        st.session_state.df = pd.read_csv(
-            csv_file,
-            dtype={
-                "Genre": str,
-                "Submitted By": str,
-                "Property": str,
-                "Availability": str,
-                "YouTube": str,
-                "Certified By": str
-            }
-        )
-    else:
-        # Create dummy data if CSV doesn't exist
-        data = [
-            {
-                "Title_Marathi": "नाटक 1",
-                "Title_English": "Play 1",
-                "Author_Marathi": "लेखक अ",
-                "Author_English": "Author A",
-                "Length": 120,
-                "Number of Acts": 3,
-                "Genre": "Drama",
-                "First Performance Year": 1990,
-                "Submitted By": "",
-                "Male Characters": 0,
-                "Female Characters": 0,
-                "Pages": 0,
-                "Property": "",
-                "Year of Writing": 0,
-                "Availability": "",
-                "YouTube": "",
-                "Certified By": ""
-            }
-        ]
-        st.session_state.df = pd.DataFrame(data)
-        st.session_state.df.to_csv(csv_file, index=False)
-
-
-# # List of new columns with their default values
-# new_columns = {
-#     "Male Characters": 0,
-#     "Female Characters": 0,
-#     "Pages": 0,
-#     "Property": "",
-#     "Year of Writing": 0,
-#     "Availability": "",
-#     "YouTube": "",
-#     "Certified By": ""
-# }
-
-# # Check if each new column exists; if not, add it with a default value
-# for col, default_val in new_columns.items():
-#     if col not in st.session_state.df.columns:
-#         st.session_state.df[col] = default_val
-
-# Convert numeric columns appropriately
-st.session_state.df["First Performance Year"] = pd.to_numeric(st.session_state.df["First Performance Year"], errors="coerce")
-st.session_state.df["Number of Acts"] = pd.to_numeric(st.session_state.df["Number of Acts"], errors="coerce")
-st.session_state.df["Length"] = pd.to_numeric(st.session_state.df["Length"], errors="coerce")
-st.session_state.df["Male Characters"] = pd.to_numeric(st.session_state.df["Male Characters"], errors="coerce")
-st.session_state.df["Female Characters"] = pd.to_numeric(st.session_state.df["Female Characters"], errors="coerce")
-st.session_state.df["Pages"] = pd.to_numeric(st.session_state.df["Pages"], errors="coerce")
-st.session_state.df["Year of Writing"] = pd.to_numeric(st.session_state.df["Year of Writing"], errors="coerce")
-st.session_state.df["Genre"] = st.session_state.df["Genre"].fillna("").astype(str)
-
-# # Optionally, save the updated DataFrame back to the CSV
-# st.session_state.df.to_csv(csv_file, index=False)
-# st.success("CSV updated with new columns.")
+csv_file = CSV_FILE
+
+
+# One shared, versioned copy of the plays data per server process. Sessions
+# only remember which version they last saw.
+@st.cache_resource
+def get_store():
+    store = PlaysStore(csv_file)
+    threading.Thread(target=warm_indexes, args=(store.current(),), name="plays-warm", daemon=True).start()
+    return store
+
+
+# Indexes that take seconds to build on a large catalogue, built in the
+# background when the store is created so the first search or duplicate
+# check does not wait for them (a session that needs one meanwhile waits
+# for this build)
+def warm_indexes(snapshot):
+    for build in (query_index, search_index, dedupe_index):
+        build(snapshot)
+
+
+# Single background writer that batches saves from all sessions
+@st.cache_resource
+def get_writer():
+    return PlaysWriter(get_store())
+
+
+# Timing spans of this rerun, for the performance panel and timing log
+run_timer = RunTimer().start()
+with span("load"):
+    store = get_store()
+    writer = get_writer()
+    snapshot = store.current()
+df = snapshot.df
+# The session records the version its own saves were published in, so only
+# changes made elsewhere are announced
+if st.session_state.get("data_version") not in (None, snapshot.version):
+    st.toast("The plays data was updated by another session.")
+st.session_state.data_version = snapshot.version
 
 # Helper function to save DataFrame to CSV
 def save_to_csv():
-    st.session_state.df.to_csv(csv_file, index=False)
+    with span("save_csv", rows=len(df)):
+        writer.compact().result()
     st.success("Data saved to 'plays.csv'!")
 
-# Sidebar menu
-st.sidebar.title("Marathi Plays Database")
-option = st.sidebar.radio("Choose an option", ["Display Plays", "Add a New Play", "Export Data"])
-
-# Display Plays
-if option == "Display Plays":
-    st.title("Browse Marathi Plays")
-
-    if st.session_state.df.empty:
-        st.warning("No data available. Please add plays or upload a database.")
-    else:
-        # Removed language selection – always display both Marathi and English columns.
-        display_df = st.session_state.df[[
-            "Title_Marathi", "Author_Marathi",
-            "Title_English", "Author_English",
-            "Length", "Number of Acts", "Genre",
-            "First Performance Year", "Submitted By", "Male Characters", "Female Characters",
-            "Pages", "Property", "Year of Writing", "Availability", "YouTube", "Certified By"
-        ]].copy()
-
-        # Filters
-        st.sidebar.write("Filtering:")
-        st.sidebar.write("Filter by Genre:")
-        filter_genre_options = ["Comedy", "Drama", "Farce", "Historical", "Musical", "Romance", "Satire", "Sci-Fi", "Tragedy", "Other"]
+
+# "Display Plays" is split into fragments that rerun on their own: the filter
+# sidebar, the results grid and the details editor. They only share state
+# through session_state (filters -> view_filters -> grid -> selected_play_id
+# -> editor). A fragment that changes what a later one depends on reruns the
+# whole app; otherwise a widget change only reruns its own fragment.
+def rerun_dependents():
+    # In a full run the later fragments run anyway, after this one
+    if not st.session_state.get("full_run"):
+        st.rerun(scope="app")
+
+
+# Fragment reruns skip the top of the script, so they time themselves
+@contextmanager
+def fragment_timer(name):
+    if st.session_state.get("full_run"):
+        yield
+        return
+    with RunTimer() as timer:
+        yield
+    log_run(timer, session=st.session_state.get("perf_session"), page=f"{option} / {name}",
+            version=store.version, rows=len(store.df))
+
+
+@st.fragment
+def filter_sidebar():
+    with fragment_timer("filters"):
+        snapshot = store.current()
+        st.write("Filtering:")
+        st.write("Filter by Genre:")
+        # Facet counts go into placeholders under the widgets once the
+        # filters are known; the widget labels stay fixed so their state is kept.
+        facet_slots = {}
         filter_selected = []
         num_per_row = 2
-        for i in range(0, len(filter_genre_options), num_per_row):
-            cols = st.sidebar.columns(num_per_row)
+        for i in range(0, len(GENRE_OPTIONS), num_per_row):
+            cols = st.columns(num_per_row)
             for j in range(num_per_row):
                 idx = i + j
-                if idx < len(filter_genre_options):
-                    opt = filter_genre_options[idx]
+                if idx < len(GENRE_OPTIONS):
+                    opt = GENRE_OPTIONS[idx]
                     if cols[j].checkbox(opt, key=f"filter_{opt}"):
                         filter_selected.append(opt)
+                    facet_slots[opt] = cols[j].empty()
         act_options_sidebar = [-1, 1, 1.5, 2, 3, 4, 0]
-        acts = st.sidebar.radio("By Number of Acts", options=act_options_sidebar, horizontal=True)
-        author_e = st.sidebar.text_input("By Author (Romanized)")
-        if author_e:
-            display_df = display_df[display_df["Author_English"].str.contains(author_e, case=False, na=False)]
-
-        author_m = st.sidebar.text_input("By लेखक (Devanagari)")
-        if author_m:
-            display_df = display_df[display_df["Author_Marathi"].str.contains(author_m, case=False, na=False)]
-        year_min = st.sidebar.number_input("Filter by Min Year", min_value=1500, max_value=2024, value=1500)
-        year_max = st.sidebar.number_input("Filter by Max Year", min_value=1500, max_value=2024, value=2024)
-        male_chars_range = st.sidebar.slider("Number of Male Characters", min_value=0, max_value=100, value=(0, 10))
-        female_chars_range = st.sidebar.slider("Number of Female Characters", min_value=0, max_value=100, value=(0, 10))
-
-        # Apply filters to display_df
-        if filter_selected:
-            # Retain rows if any of the selected genres appear in the Genre string.
-            display_df = display_df[display_df["Genre"].apply(lambda s: any(filt in s for filt in filter_selected))]
-        if acts > 0:
-            display_df = display_df[display_df["Number of Acts"] == acts]
-        elif acts == 0:
-            display_df = display_df[display_df["Number of Acts"].isna()]
-        # else:
-        #     display_df = display_df[display_df["Number of Acts"] > 0]
-        display_df = display_df[(display_df["First Performance Year"] >= year_min) & 
-                                (display_df["First Performance Year"] <= year_max)]
-        display_df = display_df[(display_df["Male Characters"] >= male_chars_range[0]) & (display_df["Male Characters"] <= male_chars_range[1])]
-        display_df = display_df[(display_df["Female Characters"] >= female_chars_range[0]) & (display_df["Female Characters"] <= female_chars_range[1])]
-
-        st.write(f"Number of plays found: {len(display_df)}")
-        # Reset selection when filters change.
-        if len(display_df) > 0:
-            st.session_state.selected_index = 0
-            st.session_state.selected_play = display_df.iloc[0]["Title_English"]
-        else:
-            st.session_state.selected_index = None
-            st.session_state.selected_play = ""
+        acts = st.radio("By Number of Acts", options=act_options_sidebar, horizontal=True)
+        facet_slots["acts"] = st.empty()
+        property_selected = st.multiselect("By Property", options=PROPERTY_OPTIONS, key="filter_property")
+        facet_slots["property"] = st.empty()
+        author_e = st.text_input("By Author (Romanized)")
+        author_m = st.text_input("By लेखक (Devanagari)")
+        text_query = st.text_input("Search Title / Author (either script)")
+        year_min = st.number_input("Filter by Min Year", min_value=1500, max_value=2024, value=1500)
+        year_max = st.number_input("Filter by Max Year", min_value=1500, max_value=2024, value=2024)
+        facet_slots["year"] = st.empty()
+        male_chars_range = st.slider("Number of Male Characters", min_value=0, max_value=100, value=(0, 10))
+        facet_slots["male"] = st.empty()
+        female_chars_range = st.slider("Number of Female Characters", min_value=0, max_value=100, value=(0, 10))
+        facet_slots["female"] = st.empty()
+
+        filters = {
+            "genres": filter_selected,
+            "acts": acts,
+            "property": property_selected,
+            "author_english": author_e,
+            "author_marathi": author_m,
+            "text": text_query,
+            "year_range": (year_min, year_max),
+            "male_range": male_chars_range,
+            "female_range": female_chars_range,
+        }
+        with span("facets", rows=len(snapshot.df)):
+            facets = facet_counts(snapshot, filters)
+        for opt in GENRE_OPTIONS:
+            facet_slots[opt].caption(f"{facets['genres'][opt]} plays")
+        facet_slots["acts"].caption(" · ".join(f"{'none' if a == 0 else a}: {n}" for a, n in facets["acts"].items() if n))
+        facet_slots["property"].caption(" · ".join(f"{p}: {n}" for p, n in facets["property"].items() if n))
+        facet_slots["year"].bar_chart(histogram(facets["year"]), height=120)
+        facet_slots["male"].bar_chart(histogram(facets["male"]), height=120)
+        facet_slots["female"].bar_chart(histogram(facets["female"]), height=120)
+
+        changed = filters != st.session_state.get("view_filters")
+        # Read by the grid, and by "Export Data" (current filtered view)
+        st.session_state.view_filters = filters
+        if changed:
+            rerun_dependents()
 
-        # Insert a "Select" column showing row index.
-        display_df = display_df.reset_index(drop=True)
-        display_df.insert(0, "Select", display_df.index)
+
+@st.fragment
+def results_grid():
+    with fragment_timer("grid"):
+        snapshot = store.current()
+        df = snapshot.df
+        filters = st.session_state.view_filters
+        filter_steps = []
+        with span("filter", rows=len(df)) as filter_span:
+            positions = filter_plays(snapshot, filters, filter_steps)
+            filter_span["steps"] = dict(filter_steps)
+        st.write(f"Number of plays found: {len(positions)}")
+
+        # Sorting and paging happen here; only the current page, with the
+        # visible columns, is sent to the grid.
+        grid_cols = st.columns([3, 1, 1, 1])
+        sort_by = grid_cols[0].selectbox("Sort by", options=[DEFAULT_SORT] + PLAY_COLUMNS, key="grid_sort")
+        descending = grid_cols[1].checkbox("Descending", key="grid_desc")
+        page_size = grid_cols[2].selectbox("Rows per page", options=PAGE_SIZES, key="grid_page_size")
+        pages = page_count(len(positions), page_size)
+        # The page lives in session_state only (no value= on the widget), so
+        # it can be clamped here when the results shrink
+        st.session_state.setdefault("grid_page", 1)
+        if st.session_state.grid_page > pages:
+            st.session_state.grid_page = pages
+        page = grid_cols[3].number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="grid_page")
+        with st.expander("Columns"):
+            visible_columns = st.multiselect("Visible columns", options=PLAY_COLUMNS, default=PLAY_COLUMNS, key="grid_columns")
+        with span("sort", rows=len(positions)):
+            positions = sort_positions(df, positions, sort_by, ascending=not descending)
+        # Remembered for "Export Data" (current filtered view)
+        st.session_state.view_sort = (sort_by, not descending)
+        with span("page_frame", rows=len(positions)):
+            display_df = page_frame(df, positions, page, page_size, visible_columns or PLAY_COLUMNS[:1])
 
         from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
         st.write("#### Click the index (Select) button to choose a play:")
-        gb = GridOptionsBuilder.from_dataframe(display_df)
+        with span("grid_build", rows=len(display_df)):
+            gb = GridOptionsBuilder.from_dataframe(display_df)
 
-        # Configure the "Select" column with a custom JS cell renderer that displays a styled button.
-        custom_cell_renderer = """
-        function(params) {
-            return '<button style="background-color:#2980b9; color:white; border:none; padding:5px 10px; border-radius:3px;">' + params.value + '</button>';
-        }
-        """
-        gb.configure_column("Select", headerName="Select", cellRenderer=custom_cell_renderer, width=80, suppressSizeToFit=True)
-
-        gb.configure_selection(selection_mode="single", use_checkbox=False)
-        grid_response = AgGrid(
-            display_df, 
-            gridOptions=gb.build(), 
-            update_mode=GridUpdateMode.SELECTION_CHANGED,
-            theme="streamlit",
-            allow_unsafe_jscode=True  # Enable the custom JS renderer
-        )
+            # Configure the "Select" column with a custom JS cell renderer that displays a styled button.
+            custom_cell_renderer = """
+            function(params) {
+                return '<button style="background-color:#2980b9; color:white; border:none; padding:5px 10px; border-radius:3px;">' + params.value + '</button>';
+            }
+            """
+            gb.configure_column("Select", headerName="Select", cellRenderer=custom_cell_renderer, width=80, suppressSizeToFit=True)
+
+            gb.configure_selection(selection_mode="single", use_checkbox=False)
+            grid_options = gb.build()
+        with span("grid_render", rows=len(display_df)):
+            grid_response = AgGrid(
+                display_df, 
+                gridOptions=grid_options, 
+                update_mode=GridUpdateMode.SELECTION_CHANGED,
+                theme="streamlit",
+                allow_unsafe_jscode=True  # Enable the custom JS renderer
+            )
+        # The editor shows the play chosen in the grid, else the first match
+        selected_id = int(df[ID_COLUMN].iat[positions[0]]) if len(positions) else None
         selected_rows = grid_response.get("selected_rows", [])
         if not isinstance(selected_rows, list):
             selected_rows = [selected_rows]
-
         if selected_rows and selected_rows[0] is not None and "Select" in selected_rows[0]:
-            sel_index = selected_rows[0]["Select"].values[0]
-            selected_play = display_df.iloc[sel_index]["Title_English"]
-            st.session_state.selected_play = selected_play
-            st.write(f"In if: Selected Play: {selected_play}")
-        else:
-            if "selected_play" not in st.session_state:
-                st.session_state.selected_play = display_df.iloc[0]["Title_English"]
-            st.write(f"In else: Selected Play: {st.session_state.selected_play}")
-        if st.session_state.selected_index is None:
+            # "Select" holds the Play ID of the row
+            selected_id = int(selected_rows[0]["Select"].values[0])
+        if selected_id != st.session_state.get("selected_play_id"):
+            st.session_state.selected_play_id = selected_id
+            rerun_dependents()
+
+
+@st.fragment
+def play_editor():
+    with fragment_timer("editor"):
+        snapshot = store.current()
+        df = snapshot.df
+        ids = id_index(snapshot)
+        selected_id = st.session_state.get("selected_play_id")
+        selected_row = ids.row(selected_id)
+        if selected_row is None:
             st.write("No play selected because no plays match the filter criteria.")
         else:
-            st.write(f"Selected Play: {st.session_state.selected_play}")
+            selected_play = df["Title_English"].iat[selected_row]
+            st.session_state.selected_play = selected_play
+            st.write(f"Selected Play: {selected_play}")
+            with st.expander("Plays like this"):
+                with span("similar", rows=len(df)):
+                    rows, scores = similar_plays(snapshot, selected_id)
+                if len(rows):
+                    similar_df = df.iloc[rows][[ID_COLUMN, "Title_Marathi", "Title_English", "Author_English", "Genre", "Number of Acts",
+                                                "Male Characters", "Female Characters", "Property", "First Performance Year"]]
+                    similar_df.insert(0, "Similarity", scores.round(2))
+                    st.dataframe(similar_df, hide_index=True)
+                else:
+                    st.write("No other plays to compare with.")
 
         # Play details update section
         st.write("### Play Details")
-        if not display_df.empty:
-            col1, col2 = st.columns(2)
-            with col1:
-                # Use the AgGrid-based selection if available.
-                if "selected_play" in st.session_state:
-                    selected_play = st.session_state.selected_play
-                else:
-                    selected_play = st.selectbox("Select a play", options=display_df["Title"])
-            filtered = display_df[display_df["Title_English"].astype(str) == str(selected_play)]
-            if not filtered.empty:
-                details = filtered.iloc[0].to_dict()
-            else:
-                st.error("No play found matching the selected title. Please re-check your selection!")
-                details = {}
+        message = st.session_state.pop("editor_message", None)
+        if message:
+            st.success(message)
+        if selected_row is not None:
+            details = play_details(snapshot, selected_id, PLAY_COLUMNS)
+            # Edits are checked against the Row Version the play had when this
+            # session started editing it
+            edit_base = st.session_state.get("edit_base")
+            if edit_base is None or edit_base[0] != selected_id:
+                edit_base = (selected_id, int(df[VERSION_COLUMN].iat[selected_row]))
+                st.session_state.edit_base = edit_base
             
             updated_details = {}
-            for key, value in details.items():
-                if key == "Genre":
-                    genre_options = ["Comedy", "Drama", "Farce", "Historical", "Musical", "Romance", "Satire", "Sci-Fi", "Tragedy", "Other"]
-                    # Ensure the value is a string (convert NaN or None to an empty string)
-                    value_str = value if isinstance(value, str) else ""
-                    # Split the current genre string by semicolon to get pre-selected genres
-                    preselected = [g.strip() for g in value_str.split(";")] if value_str else []
-                    st.write("**Genre**")
-                    upd_selected = []
-                    num_per_row = 5
-                    for i in range(0, len(genre_options), num_per_row):
+            with span("editor", fields=len(details)):
+                for key, value in details.items():
+                    if key == "Genre":
+                        genre_options = GENRE_OPTIONS
+                        # Ensure the value is a string (convert NaN or None to an empty string)
+                        value_str = value if isinstance(value, str) else ""
+                        # Split the current genre string by semicolon to get pre-selected genres
+                        preselected = [g.strip() for g in value_str.split(";")] if value_str else []
+                        st.write("**Genre**")
+                        upd_selected = []
+                        num_per_row = 5
+                        for i in range(0, len(genre_options), num_per_row):
+                            upd_cols = st.columns(num_per_row)
+                            for j in range(num_per_row):
+                                idx = i + j
+                                if idx < len(genre_options):
+                                    g = genre_options[idx]
+                                    if upd_cols[j].checkbox(g, value=(g in preselected), key=f"upd_{selected_id}_{g}"):
+                                        upd_selected.append(g)
+                        updated_value = "; ".join(upd_selected)
+                    elif key == "Number of Acts":
+                        act_options = ACT_OPTIONS
+                        try:
+                            default_index = act_options.index(value)
+                        except ValueError:
+                            default_index = 0
+                        updated_value = st.radio("**Number of Acts**", options=act_options, index=default_index, key=f"upd_{selected_id}_acts", horizontal=True)
+                    elif key == "Property":
+                        property_options = PROPERTY_OPTIONS
+                        # Set default index based on current value or default to 0 if not in options
+                        try:
+                            default_index = property_options.index(value)
+                        except ValueError:
+                            default_index = 0
+                        updated_value = st.radio("**Property**", options=property_options, index=default_index, key=f"upd_{selected_id}_Property", horizontal=True)
+                    elif key == "Availability":
+                        availability_options = AVAILABILITY_OPTIONS
+                        st.write("**Availability**")
+                        avail_selected = []
+                        num_per_row = len(availability_options)
                         upd_cols = st.columns(num_per_row)
-                        for j in range(num_per_row):
-                            idx = i + j
-                            if idx < len(genre_options):
-                                g = genre_options[idx]
-                                if upd_cols[j].checkbox(g, value=(g in preselected), key=f"upd_{selected_play}_{g}"):
-                                    upd_selected.append(g)
-                    updated_value = "; ".join(upd_selected)
-                elif key == "Number of Acts":
-                    act_options = [1, 1.5, 2, 3, 4, 0]
-                    try:
-                        default_index = act_options.index(value)
-                    except ValueError:
-                        default_index = 0
-                    updated_value = st.radio("**Number of Acts**", options=act_options, index=default_index, key=f"upd_{selected_play}_acts", horizontal=True)
-                elif key == "Property":
-                    property_options = ["Unknown", "No property", "Minimal", "Extensive", "Different acts"]
-                    # Set default index based on current value or default to 0 if not in options
-                    try:
-                        default_index = property_options.index(value)
-                    except ValueError:
-                        default_index = 0
-                    updated_value = st.radio("**Property**", options=property_options, index=default_index, key=f"upd_{selected_play}_Property", horizontal=True)
-                elif key == "Availability":
-                    availability_options = ["Print", "Abhivyakti", "CALAA", "NULL"]
-                    st.write("**Availability**")
-                    avail_selected = []
-                    num_per_row = len(availability_options)
-                    upd_cols = st.columns(num_per_row)
-                    for i, opt in enumerate(availability_options):
-                        # Pre-select if the current value string contains this option.
-                        preselected = opt in value.split(";") if isinstance(value, str) else False
-                        if upd_cols[i].checkbox(opt, value=preselected, key=f"upd_{selected_play}_{opt}"):
-                            avail_selected.append(opt)
-                    if "NULL" in avail_selected and len(avail_selected) > 1:
-                        avail_selected.remove("NULL")
-                    updated_value = "; ".join(avail_selected)
-                else:
-                    updated_value = st.text_input(f"**{key}**", value)
-                updated_details[key] = updated_value
+                        for i, opt in enumerate(availability_options):
+                            # Pre-select if the current value string contains this option.
+                            preselected = opt in value.split(";") if isinstance(value, str) else False
+                            if upd_cols[i].checkbox(opt, value=preselected, key=f"upd_{selected_id}_{opt}"):
+                                avail_selected.append(opt)
+                        avail_selected = normalize_availability(avail_selected)
+                        updated_value = "; ".join(avail_selected)
+                    else:
+                        updated_value = st.text_input(f"**{key}**", value)
+                    updated_details[key] = updated_value
             
             passphrase = st.text_input("Enter passphrase to save changes", type="password")
             
             if st.button("Save Changes"):
                 if passphrase == st.secrets["credentials"]["passphrase"]:
-                    # Use Title_English as the unique identifier for current row
-                    original_title_english = details.get("Title_English")
-                    mask = (st.session_state.df["Title_English"] == original_title_english)
-                    idx_list = st.session_state.df[mask].index.tolist()
-                    if idx_list:
-                        row_idx = idx_list[0]
+                    # Use the Play ID as the unique identifier for current row
+                    row_idx = ids.row(selected_id)
+                    if row_idx is not None:
                         # Check if the updated Title_English already exists in another row.
                         new_title = updated_details.get("Title_English", "").strip()
-                        duplicate = st.session_state.df[
-                            (st.session_state.df["Title_English"].str.lower() == new_title.lower()) &
-                            (st.session_state.df.index != row_idx)
-                        ]
-                        if not duplicate.empty:
+                        duplicate_ids = ids.ids_with_title(new_title) - {selected_id}
+                        if duplicate_ids:
+                            duplicate = df.iloc[sorted(ids.row(i) for i in duplicate_ids)]
                             st.error("The updated English title already exists in another play. If this is a different play (for example, with a different author) suffix the Marathi title with #2, #3 etc. Existing row(s):")
                             st.dataframe(duplicate)
                         else:
-                            for key, value in updated_details.items():
-                                st.session_state.df.at[row_idx, key] = value
-                            st.session_state.df.to_csv(csv_file, index=False)
-                            st.success("Changes saved successfully!")
+                            try:
+                                with span("save"):
+                                    saved = writer.submit_update(selected_id, updated_details, edit_base[1])
+                                    new_version = saved.result(timeout=30)
+                                    st.session_state.data_version = saved.data_version
+                            except ConflictError as exc:
+                                st.error("This play was changed by someone else after you opened it, so your changes were not saved. "
+                                         "Its current values are below; press Save Changes again to overwrite them with yours.")
+                                st.dataframe([{key: exc.current.get(key) for key in PLAY_COLUMNS}])
+                                st.session_state.edit_base = (selected_id, int(exc.current[VERSION_COLUMN]))
+                            except KeyError:
+                                st.error("This play no longer exists, so your changes were not saved.")
+                            except concurrent.futures.TimeoutError:
+                                st.error("Saving is taking too long, so your changes may not have been saved. Please try again in a moment.")
+                            else:
+                                st.session_state.edit_base = (selected_id, new_version)
+                                # The grid and the counts show the saved values
+                                st.session_state.editor_message = "Changes saved successfully!"
+                                st.rerun(scope="app")
                     else:
                         st.error("Could not match the selected row in the main DataFrame.")
                 else:
                     st.error("Incorrect passphrase. Changes not saved.")
 
-# Add a New Play
-elif option == "Add a New Play":
-    st.title("Add a New Marathi Play")
-
-    with st.form("Add Play Form"):
-        # Compulsory Fields
-        title_marathi = st.text_input("Title_Marathi", help="This field is compulsory.")
-        title_english = st.text_input("Title_English", help="This field is compulsory.")
-        author_marathi = st.text_input("Author_Marathi", help="This field is compulsory.")
-        author_english = st.text_input("Author_English", help="This field is compulsory.")
-
-        # Optional Fields
-        length = st.number_input("Length (in minutes)", min_value=1, help="Optional.")
-        act_options = [1, 1.5, 2, 3, 4, 0]
-        num_acts = st.radio("Number of Acts", options=act_options, index=0, horizontal=True)
-        st.write("Select Genre(s) (optional):")
-        genre_options = ["Comedy", "Drama", "Farce", "Historical", "Musical", "Romance", "Satire", "Sci-Fi", "Tragedy", "Other"]
-        add_selected = []
-        num_per_row = 5
-        for i in range(0, len(genre_options), num_per_row):
+
+# Set for the length of a full run and cleared however it ends (st.rerun,
+# st.stop or an error included); fragment reruns find it unset
+st.session_state.full_run = True
+try:
+    # Sidebar menu
+    st.sidebar.title("Marathi Plays Database")
+    option = st.sidebar.radio("Choose an option", ["Display Plays", "Add a New Play", "Bulk Import", "Find Duplicates", "Export Data"])
+
+    # Display Plays
+    if option == "Display Plays":
+        st.title("Browse Marathi Plays")
+
+        if df.empty:
+            st.warning("No data available. Please add plays or upload a database.")
+        else:
+            with st.sidebar:
+                filter_sidebar()
+            results_grid()
+            play_editor()
+
+    # Add a New Play
+    elif option == "Add a New Play":
+        st.title("Add a New Marathi Play")
+
+        with st.form("Add Play Form"):
+            # Compulsory Fields
+            title_marathi = st.text_input("Title_Marathi", help="This field is compulsory.")
+            title_english = st.text_input("Title_English", help="This field is compulsory.")
+            author_marathi = st.text_input("Author_Marathi", help="This field is compulsory.")
+            author_english = st.text_input("Author_English", help="This field is compulsory.")
+
+            # Optional Fields
+            length = st.number_input("Length (in minutes)", min_value=1, help="Optional.")
+            act_options = ACT_OPTIONS
+            num_acts = st.radio("Number of Acts", options=act_options, index=0, horizontal=True)
+            st.write("Select Genre(s) (optional):")
+            genre_options = GENRE_OPTIONS
+            add_selected = []
+            num_per_row = 5
+            for i in range(0, len(genre_options), num_per_row):
+                cols = st.columns(num_per_row)
+                for j in range(num_per_row):
+                    idx = i + j
+                    if idx < len(genre_options):
+                        opt = genre_options[idx]
+                        if cols[j].checkbox(opt, key=f"add_genre_{opt}"):
+                            add_selected.append(opt)
+            # Save as semicolon-separated list; if nothing is selected, genre remains an empty string.
+            genre = "; ".join(add_selected)
+            first_year = st.number_input("First Performance Year", min_value=1500, max_value=2024, help="Optional.")
+            submitted_by = st.text_input("Submitted By", help="Optional.")
+            male_chars = st.number_input("Number of Male Characters", min_value=0, help="Optional.")
+            female_chars = st.number_input("Number of Female Characters", min_value=0, help="Optional.")
+            pages = st.number_input("Number of Pages", min_value=0, help="Optional.")
+            property_options = PROPERTY_OPTIONS
+            property_val = st.radio("Property", options=property_options, index=0, horizontal=True)
+            st.write("Selected:", property_val)
+            year_writing = st.number_input("Year of Writing", min_value=1500, max_value=2024, help="Optional.")
+            availability_options = AVAILABILITY_OPTIONS
+            st.write("Availability")
+            avail_selected = []
+            num_per_row = len(availability_options)
             cols = st.columns(num_per_row)
-            for j in range(num_per_row):
-                idx = i + j
-                if idx < len(genre_options):
-                    opt = genre_options[idx]
-                    if cols[j].checkbox(opt, key=f"add_genre_{opt}"):
-                        add_selected.append(opt)
-        # Save as semicolon-separated list; if nothing is selected, genre remains an empty string.
-        genre = "; ".join(add_selected)
-        first_year = st.number_input("First Performance Year", min_value=1500, max_value=2024, help="Optional.")
-        submitted_by = st.text_input("Submitted By", help="Optional.")
-        male_chars = st.number_input("Number of Male Characters", min_value=0, help="Optional.")
-        female_chars = st.number_input("Number of Female Characters", min_value=0, help="Optional.")
-        pages = st.number_input("Number of Pages", min_value=0, help="Optional.")
-        property_options = ["Unknown", "No property", "Minimal", "Extensive", "Different acts"]
-        property_val = st.radio("Property", options=property_options, index=0, horizontal=True)
-        st.write("Selected:", property_val)
-        year_writing = st.number_input("Year of Writing", min_value=1500, max_value=2024, help="Optional.")
-        availability_options = ["Print", "Abhivyakti", "CALAA", "NULL"]
-        st.write("Availability")
-        avail_selected = []
-        num_per_row = len(availability_options)
-        cols = st.columns(num_per_row)
-        for i, opt in enumerate(availability_options):
-            if cols[i].checkbox(opt, key=f"avail_{opt}"):
-                avail_selected.append(opt)
-        # If any non-NULL option is selected, remove "NULL" even if checked.
-        if "NULL" in avail_selected and len(avail_selected) > 1:
-            avail_selected.remove("NULL")
-        # Join selections into a string (or process as needed)
-        availability = "; ".join(avail_selected)
-        st.write("Selected: ", availability)
-        youtube_link = st.text_input("YouTube (Link)", help="Optional.")
-        certified_by = st.text_input("Certified By", help="This field is compulsory.")
-
-        passphrase = st.text_input("Enter passphrase to submit the new play", type="password", key="passphrase_add")
-        submitted = st.form_submit_button("Submit")
-        if submitted:
+            for i, opt in enumerate(availability_options):
+                if cols[i].checkbox(opt, key=f"avail_{opt}"):
+                    avail_selected.append(opt)
+            # If any non-NULL option is selected, remove "NULL" even if checked.
+            avail_selected = normalize_availability(avail_selected)
+            # Join selections into a string (or process as needed)
+            availability = "; ".join(avail_selected)
+            st.write("Selected: ", availability)
+            youtube_link = st.text_input("YouTube (Link)", help="Optional.")
+            certified_by = st.text_input("Certified By", help="This field is compulsory.")
+
+            not_duplicate = st.checkbox("This is a different play from the likely duplicates listed (if any)", key="add_not_duplicate")
+            passphrase = st.text_input("Enter passphrase to submit the new play", type="password", key="passphrase_add")
+            submitted = st.form_submit_button("Submit")
+            if submitted:
+                if passphrase != st.secrets["credentials"]["passphrase"]:
+                    st.error("Incorrect passphrase. New play not added.")
+                else:
+                    # Check for duplicate Title_English across all plays (case insensitive)
+                    ids = id_index(snapshot)
+                    duplicate_ids = ids.ids_with_title(title_english)
+                    if duplicate_ids:
+                        duplicate = df.iloc[sorted(ids.row(i) for i in duplicate_ids)]
+                        st.error("A play with this English title already exists. If this is a different play (for example, with a different author) suffix the Marathi title with #2, #3 etc. Existing row(s):")
+                        st.dataframe(duplicate)
+                    else:
+                        new_entry = {
+                            "Title_Marathi": title_marathi,
+                            "Title_English": title_english,
+                            "Author_Marathi": author_marathi,
+                            "Author_English": author_english,
+                            "Length": length,
+                            "Number of Acts": num_acts,
+                            "Genre": genre,
+                            "First Performance Year": first_year,
+                            "Submitted By": submitted_by,
+                            "Male Characters": male_chars,
+                            "Female Characters": female_chars,
+                            "Pages": pages,
+                            "Property": property_val,
+                            "Year of Writing": year_writing,
+                            "Availability": availability,
+                            "YouTube": youtube_link,
+                            "Certified By": certified_by
+                        }
+                        if missing_required(new_entry):
+                            st.error("Please fill out all compulsory fields: Title (Marathi and English), Author (Marathi and English), and Certified By.")
+                        else:
+                            # Look for near duplicates (spelling variants, other script, suffixes)
+                            with span("duplicates", rows=len(df)):
+                                likely = dedupe_index(snapshot).candidates(new_entry, size=len(df))
+                            if likely and not not_duplicate:
+                                st.warning("This play looks like one or more existing plays. If it is a different play, tick the box above and submit again. Likely duplicate(s):")
+                                likely_df = df.iloc[[row for row, _ in likely]][[ID_COLUMN] + PLAY_COLUMNS[:4]]
+                                likely_df.insert(0, "Similarity", [round(sim, 2) for _, sim in likely])
+                                st.dataframe(likely_df)
+                            else:
+                                try:
+                                    with span("add"):
+                                        added = writer.submit_insert([new_entry])
+                                        added.result(timeout=30)
+                                        st.session_state.data_version = added.data_version
+                                except concurrent.futures.TimeoutError:
+                                    st.error("Adding the play is taking too long, so it may not have been added. Please check \"Display Plays\" before trying again.")
+                                else:
+                                    st.success("New play added successfully!")
+                                    st.dataframe(store.df)
+
+    # Bulk Import
+    elif option == "Bulk Import":
+        st.title("Bulk Import Plays")
+        st.write("Upload a CSV or JSON Lines file with one play per row, using the same column names as `plays.csv`. "
+                 "Rows are checked against the same rules as the \"Add a New Play\" form; rejected rows are listed with the reason.")
+        uploaded = st.file_uploader("File to import", type=["csv", "jsonl", "json"])
+        dry_run = st.checkbox("Only validate, do not add any plays", key="import_dry_run")
+        passphrase = st.text_input("Enter passphrase to import plays", type="password", key="passphrase_import")
+        if uploaded is not None and st.button("Import"):
             if passphrase != st.secrets["credentials"]["passphrase"]:
-                st.error("Incorrect passphrase. New play not added.")
+                st.error("Incorrect passphrase. No plays imported.")
             else:
-                # Check for duplicate Title_English in the full DataFrame (case insensitive)
-                duplicate = st.session_state.df[
-                    st.session_state.df["Title_English"].str.lower() == title_english.lower()
-                ]
-                if not duplicate.empty:
-                    st.error("A play with this English title already exists. If this is a different play (for example, with a different author) suffix the Marathi title with #2, #3 etc. Existing row(s):")
-                    st.dataframe(duplicate)
+                with st.spinner("Validating and importing..."), span("import") as import_span:
+                    # Validated in this process: the server is threaded, and an
+                    # upload is small next to the cost of starting workers
+                    added, report = import_plays(store, uploaded, workers=1, dry_run=dry_run, writer=writer)
+                    import_span.update(added=added, rejected=len(report))
+                if added and not dry_run:
+                    st.session_state.data_version = store.version
+                if dry_run:
+                    st.success(f"{added} plays are valid and can be imported.")
                 else:
-                    new_entry = {
-                        "Title_Marathi": title_marathi,
-                        "Title_English": title_english,
-                        "Author_Marathi": author_marathi,
-                        "Author_English": author_english,
-                        "Length": length,
-                        "Number of Acts": num_acts,
-                        "Genre": genre,
-                        "First Performance Year": first_year,
-                        "Submitted By": submitted_by,
-                        "Male Characters": male_chars,
-                        "Female Characters": female_chars,
-                        "Pages": pages,
-                        "Property": property_val,
-                        "Year of Writing": year_writing,
-                        "Availability": availability,
-                        "YouTube": youtube_link,
-                        "Certified By": certified_by
-                    }
-                    if not title_marathi or not title_english or not author_marathi or not author_english or not certified_by:
-                        st.error("Please fill out all compulsory fields: Title (Marathi and English), Author (Marathi and English), and Certified By.")
-                    else:
-                        st.session_state.df = pd.concat([st.session_state.df, pd.DataFrame([new_entry])], ignore_index=True)
-                        save_to_csv()
-                        st.success("New play added successfully!")
-                        st.dataframe(st.session_state.df)
-
-# Export Data
-elif option == "Export Data":
-    st.title("Export Database")
-    if st.button("Save to CSV"):
-        save_to_csv()
+                    st.success(f"{added} plays imported.")
+                if len(report):
+                    st.error(f"{len(report)} rows were rejected:")
+                    st.dataframe(report, hide_index=True)
+                    st.download_button("Download error report", report.to_csv(index=False), file_name="import_errors.csv", mime="text/csv")
+
+    # Find Duplicates
+    elif option == "Find Duplicates":
+        st.title("Find Duplicate Plays")
+        st.write("Groups of plays whose titles and authors look alike, across Marathi and English spellings.")
+        min_similarity = st.slider("Minimum similarity", min_value=0.3, max_value=1.0, value=0.6, step=0.05)
+        if st.button("Find duplicate clusters"):
+            with span("clusters", rows=len(df)):
+                clusters = dedupe_index(snapshot).clusters(min_similarity, size=len(df))
+            st.write(f"Number of clusters found: {len(clusters)}")
+            for rows in clusters:
+                st.dataframe(df.iloc[rows][[ID_COLUMN] + PLAY_COLUMNS[:4]], hide_index=True)
+
+    # Export Data
+    elif option == "Export Data":
+        st.title("Export Database")
+        view_filters = st.session_state.get("view_filters")
+        scope_options = ["Full catalogue"] + (["Current filtered view"] if view_filters is not None else [])
+        scope = st.radio("Plays to export", options=scope_options, horizontal=True)
+        if scope == "Current filtered view":
+            positions = filter_plays(snapshot, view_filters)
+            positions = sort_positions(df, positions, *st.session_state.view_sort)
+        else:
+            positions = None
+        export_columns = st.multiselect("Columns", options=[ID_COLUMN] + PLAY_COLUMNS, default=[ID_COLUMN] + PLAY_COLUMNS)
+        export_format = st.selectbox("Format", options=list(EXPORT_FORMATS))
+        st.write(f"Number of plays to export: {len(df) if positions is None else len(positions)}")
+        if st.button("Prepare download"):
+            # The rows are converted chunk by chunk, but download_button needs the
+            # finished file as bytes, so the whole export is held in memory until
+            # the download is served. The snapshot is read-only, so other
+            # sessions carry on meanwhile.
+            extension, mime = EXPORT_FORMATS[export_format]
+            export_file = io.BytesIO()
+            with st.spinner("Preparing export..."), span("export", rows=len(df) if positions is None else len(positions)):
+                write_export(export_file, df, positions, export_columns or None, export_format)
+            st.download_button("Download", data=export_file.getvalue(), file_name=f"plays{extension}", mime=mime)
+
+        st.write("#### Server copy")
+        if st.button("Save to CSV"):
+            save_to_csv()
+finally:
+    st.session_state.full_run = False
+
+
+# Timing of this rerun: always appended to the timing log, shown in the
+# sidebar on request
+run_timer.stop()
+if "perf_session" not in st.session_state:
+    st.session_state.perf_session = uuid.uuid4().hex[:12]
+memory = session_bytes(st.session_state)
+log_run(run_timer, session=st.session_state.perf_session, page=option, version=snapshot.version,
+        rows=len(df), session_bytes=memory)
+if st.sidebar.checkbox("Show performance panel", key="perf_panel"):
+    with st.sidebar.expander("Performance (this rerun)", expanded=True):
+        st.write(f"Total: {run_timer.total_ms:.1f} ms, data version {snapshot.version}, {len(df)} plays")
+        st.write(f"Session state: {memory / 1024:.1f} KiB")
+        st.dataframe(pd.DataFrame([{
+            "Stage": "· " * item["depth"] + item["name"],
+            "ms": round(item["ms"], 2),
+            "Rows": item.get("rows", item.get("fields")),
+        } for item in run_timer.spans]), hide_index=True)
+        steps = next((item["steps"] for item in run_timer.spans if item["name"] == "filter"), None)
+        if steps:
+            st.write("Rows left after each filter:")
+            st.dataframe(pd.DataFrame({"Filter": ["(all plays)"] + list(steps), "Rows": [len(df)] + list(steps.values())}), hide_index=True)
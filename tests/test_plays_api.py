@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from plays_api import PlaysApi, PlaysData, _serve_client
+from plays_search import search_index
+from plays_store import PLAY_COLUMNS, PlaysStore
+from plays_writer import PlaysWriter
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A missing CSV is created with the dummy plays
+    return PlaysStore(str(tmp_path / "plays.csv"))
+
+
+def new_play(store, title):
+    return dict(store.df.iloc[0][PLAY_COLUMNS], Title_Marathi=title, Title_English=title, **{"Certified By": "Test"})
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length_is_a_bad_request(store, length):
+    api = PlaysApi(PlaysData(store.csv_file))
+
+    async def request():
+        server = await asyncio.start_server(lambda r, w: _serve_client(api, r, w), "127.0.0.1", 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(f"GET /plays HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+            response = await reader.read()
+            writer.close()
+            return response
+
+    assert asyncio.run(request()).startswith(b"HTTP/1.1 400 Bad Request\r\n")
+
+
+def test_refresh_follows_the_log_across_a_compaction(store):
+    writer = PlaysWriter(store, batch_window=0)
+    data = PlaysData(store.csv_file)
+    data.refresh()
+    loaded, index = data.store, search_index(data.store.current())
+
+    writer.submit_insert([new_play(store, "Logged Play")]).result(timeout=10)
+    data.refresh()
+    writer.submit_insert([new_play(store, "Compacted Play")]).result(timeout=10)
+    writer.compact().result(timeout=10)
+    data.refresh()
+
+    # Same store and search index, carried forward rather than rebuilt
+    assert data.store is loaded
+    assert search_index(data.store.current()) is index
+    assert list(data.store.df["Title_English"]) == list(store.df["Title_English"])
+    assert index.search("Compacted Play")
@@ -0,0 +1,105 @@
+import shutil
+import time
+
+import pandas as pd
+import pytest
+
+from plays_import import import_plays
+from plays_store import ID_COLUMN, PLAY_COLUMNS, VERSION_COLUMN, PlaysStore
+from plays_writer import ConflictError, PlaysWriter
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A missing CSV is created with the dummy plays
+    return PlaysStore(str(tmp_path / "plays.csv"))
+
+
+def new_play(store, title):
+    return dict(store.df.iloc[0][PLAY_COLUMNS], Title_Marathi=title, Title_English=title, **{"Certified By": "Test"})
+
+
+def test_stale_update_conflicts(store):
+    writer = PlaysWriter(store, batch_window=0)
+    play_id = int(store.df[ID_COLUMN].iat[0])
+    base = int(store.df[VERSION_COLUMN].iat[0])
+
+    assert writer.submit_update(play_id, {"Length": 90}, base).result(timeout=10) == base + 1
+    with pytest.raises(ConflictError) as exc:
+        writer.submit_update(play_id, {"Length": 60}, base).result(timeout=10)
+    assert exc.value.play_id == play_id
+    assert exc.value.current[VERSION_COLUMN] == base + 1
+    assert store.df["Length"].iat[0] == 90
+
+
+def test_replay_over_compacted_csv(store):
+    writer = PlaysWriter(store, batch_window=0)
+    play_id = int(store.df[ID_COLUMN].iat[0])
+    base = int(store.df[VERSION_COLUMN].iat[0])
+    [new_id] = writer.submit_insert([new_play(store, "Replayed Play")]).result(timeout=10)
+    writer.submit_update(play_id, {"Length": 75}, base).result(timeout=10)
+    # A crash after the CSV was rewritten but before the log was cleared
+    kept = writer.log_file + ".kept"
+    shutil.copy(writer.log_file, kept)
+    writer.compact().result(timeout=10)
+    shutil.copy(kept, writer.log_file)
+
+    replayed = PlaysStore(store.csv_file)
+    PlaysWriter(replayed, batch_window=0)
+    df = replayed.df
+    assert len(df) == len(store.df)
+    assert (df[ID_COLUMN] == new_id).sum() == 1
+    row = df.index[df[ID_COLUMN] == play_id][0]
+    assert df.at[row, "Length"] == 75
+    assert df.at[row, VERSION_COLUMN] == base + 1
+
+
+def test_import_from_another_process_survives_compaction(store, tmp_path):
+    writer = PlaysWriter(store, batch_window=0)
+    source = tmp_path / "import.csv"
+    pd.DataFrame([new_play(store, "Imported Play")]).to_csv(source, index=False)
+
+    # The command line's own store, as in a separate process
+    added, report = import_plays(PlaysStore(store.csv_file), str(source), workers=1)
+    assert added == 1 and report.empty
+    [app_id] = writer.submit_insert([new_play(store, "Added In The App")]).result(timeout=10)
+    writer.compact().result(timeout=10)
+
+    df = PlaysStore(store.csv_file).df
+    assert set(df["Title_English"]) >= {"Imported Play", "Added In The App"}
+    assert df[ID_COLUMN].is_unique
+    assert app_id in set(df[ID_COLUMN])
+
+
+def test_import_after_the_app_compacted(store, tmp_path):
+    writer = PlaysWriter(store, batch_window=0)
+    source = tmp_path / "import.csv"
+    pd.DataFrame([new_play(store, "Imported Play")]).to_csv(source, index=False)
+    # Loaded before the app's add and compaction, as by a slow import
+    command_line = PlaysStore(store.csv_file)
+
+    [app_id] = writer.submit_insert([new_play(store, "Added In The App")]).result(timeout=10)
+    writer.compact().result(timeout=10)
+    added, report = import_plays(command_line, str(source), workers=1)
+    assert added == 1 and report.empty
+    writer.compact().result(timeout=10)
+
+    df = PlaysStore(store.csv_file).df
+    assert set(df["Title_English"]) >= {"Imported Play", "Added In The App"}
+    assert df[ID_COLUMN].is_unique
+
+
+def test_writer_survives_a_failed_idle_compaction(store, monkeypatch):
+    writer = PlaysWriter(store, batch_window=0, compact_idle=0.05)
+    play_id = int(store.df[ID_COLUMN].iat[0])
+    base = int(store.df[VERSION_COLUMN].iat[0])
+
+    def disk_full():
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(store, "save", disk_full)
+    writer.submit_update(play_id, {"Length": 80}, base).result(timeout=10)
+    time.sleep(0.3)  # a few idle compactions, all failing
+    assert writer._thread.is_alive()
+    monkeypatch.undo()
+    assert writer.submit_update(play_id, {"Length": 85}, base + 1).result(timeout=10) == base + 2